@@ -0,0 +1,346 @@
+"""
+benchmark.py
+
+Measures the slow parts of ida against a web server that runs on this computer and serves synthetic feeds, so that one version of ida can be compared with the next. For each number of feeds it runs these stages:
+
+import      read an OPML file of the feeds and check every link (ida.read_OPML(), ida.OPML_feeds())
+check       download and compare every feed (ida.find_all_changes(), ida.get_feed_status())
+recheck     the same again; this time every feed answers "304 Not Modified"
+discover    find the RSS address of BENCHMARK_SITES websites, one after another (ida.findfeed())
+list        draw the list of feeds BENCHMARK_LISTINGS times (ida.print_feeds()); the first time also builds the unread article index
+
+and prints the number of feeds (or websites, or feeds listed) handled per second, the 50th, 90th and 99th percentile time of one download (or one listing), and the most memory used at any one time. Memory is measured with tracemalloc, which makes everything a little slower.
+
+The benchmark runs in a temporary directory, so ida.db, titles_read.bin and http_cache.db are not touched.
+
+    python benchmark.py [number of feeds ...] [--latency SECONDS] [--entries N] [--size BYTES] [--processes N]
+"""
+
+import contextlib
+import http.server
+import io
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from sys import argv
+
+import ida
+
+# === SETTINGS ==============
+
+# numbers of synthetic feeds, seconds the test server waits before answering, posts in each feed, and bytes of text in each post
+BENCHMARK_FEEDS = [10, 100, 1000]
+BENCHMARK_LATENCY = 0.05
+BENCHMARK_ENTRIES = 20
+BENCHMARK_ENTRY_SIZE = 500
+
+# number of websites that the benchmark runs ida.findfeed() on, and number of times it draws the list of feeds
+BENCHMARK_SITES = 50
+BENCHMARK_LISTINGS = 20
+
+
+# === BENCHMARK ================
+
+
+class BenchmarkServer(http.server.ThreadingHTTPServer):
+    """
+    Test web server for benchmark(). It answers many requests at the same time, like the many websites of a real set of feeds.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # ida's is_feed() hangs up after the first bytes of a link on purpose; keep the benchmark's report readable
+        return
+
+
+class BenchmarkHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers the requests sent to BenchmarkServer. /feed/<n> is the RSS feed of website <n>, with (entries) posts of (entry_size) bytes each; /site/<n> is the home page of website <n>, which links to its feed. Every answer waits (latency) seconds first, like a website far away. A feed whose ETag is sent back (conditional GET) answers "304 Not Modified".
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = BENCHMARK_LATENCY
+    entries = BENCHMARK_ENTRIES
+    entry_size = BENCHMARK_ENTRY_SIZE
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def respond(self, send_body):
+        time.sleep(self.latency)
+
+        kind, _, n = self.path.strip("/").partition("/")
+        etag = '"' + n + '"'
+        if kind == "feed" and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if kind == "feed":
+            content_type = "application/rss+xml"
+            body = benchmark_feed(n, self.entries, self.entry_size)
+        elif kind == "site":
+            content_type = "text/html"
+            body = benchmark_site(n)
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if kind == "feed":
+            self.send_header("ETag", etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the benchmark's report readable
+        return
+
+
+def benchmark_feed(n, entries, entry_size):
+    """
+    Utility that returns the RSS feed of synthetic website (n), as bytes.
+    """
+    text = ("lorem ipsum " * (entry_size // 12 + 1))[:entry_size]
+    items = []
+    for i in range(entries):
+        link = "http://example.com/" + n + "/post/" + str(i)
+        items.append(
+            "<item><title>Post " + str(i) + " on website " + n + "</title>"
+            "<link>" + link + "</link><guid>" + link + "</guid>"
+            "<description>" + text + "</description></item>"
+        )
+    feed = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<rss version="2.0"><channel><title>Website ' + n + "</title>"
+        "<link>http://example.com/" + n + "</link>" + "".join(items) + "</channel></rss>"
+    )
+
+    return feed.encode("utf-8")
+
+
+def benchmark_site(n):
+    """
+    Utility that returns the home page of synthetic website (n), as bytes. It links to its feed the way most websites do, and has a few other links for ida.findfeed() to reject.
+    """
+    page = (
+        "<html><head><title>Website " + n + "</title>"
+        '<link rel="alternate" type="application/rss+xml" href="/feed/' + n + '">'
+        '</head><body><a href="/site/' + n + '/feedback">Feedback</a>'
+        '<a href="/feed/' + n + '">RSS</a><a href="/about">About</a></body></html>'
+    )
+
+    return page.encode("utf-8")
+
+
+def benchmark(feed_counts=BENCHMARK_FEEDS, latency=BENCHMARK_LATENCY, entries=BENCHMARK_ENTRIES, entry_size=BENCHMARK_ENTRY_SIZE, processes=ida.PARSE_PROCESSES):
+    """
+    Run the benchmark for each number of feeds in [feed_counts] and print the results. The feeds are parsed by (processes) processes when there are enough of them (see ida.find_all_changes()). USED ONLY BY THE DEVELOPER.
+    """
+    BenchmarkHandler.latency = latency
+    BenchmarkHandler.entries = entries
+    BenchmarkHandler.entry_size = entry_size
+    server = BenchmarkServer(("127.0.0.1", 0), BenchmarkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:" + str(server.server_address[1])
+
+    # import the heavy modules now, so the first stage is not charged for them
+    for module in (ida.feedparser, ida.requests, ida.bs4):
+        module.load()
+
+    print("=" * 30, " BENCHMARK ", "=" * 30, sep="")
+    print(
+        "latency: ", int(latency * 1000), " ms   posts per feed: ", entries,
+        "   bytes per post: ", entry_size, "   parse processes: ", processes, sep="",
+    )
+    print()
+    print("{:<9} {:>6} {:>9} {:>9} {:>8} {:>8} {:>8} {:>8}".format(
+        "stage", "feeds", "seconds", "per sec", "p50 ms", "p90 ms", "p99 ms", "peak MB"))
+
+    start_dir = os.getcwd()
+    try:
+        for count in feed_counts:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                # start from nothing: no database, no cache, no read articles
+                os.chdir(tmp_dir)
+                ida.db_connection = None
+                ida.saved_groups, ida.saved_feeds = {}, {}
+                ida.clear_unread_index()
+                ida.feed_checks.clear()
+                try:
+                    for row in benchmark_feeds(base, count, processes):
+                        print_benchmark_row(row)
+                finally:
+                    if ida.db_connection is not None:
+                        ida.db_connection.close()
+                        ida.db_connection = None
+                    if getattr(ida.http_cache, "db", None) is not None:
+                        ida.http_cache.db.close()
+                        ida.http_cache.db = None
+                    os.chdir(start_dir)
+            print()
+    finally:
+        os.chdir(start_dir)
+        server.shutdown()
+        server.server_close()
+
+    print("=" * 71)
+
+    return None
+
+
+def benchmark_feeds(base, count, processes=ida.PARSE_PROCESSES):
+    """
+    Utility for benchmark(): run every stage with (count) feeds served from the test server at (base). Returns one row per stage (see benchmark_stage()).
+    """
+    rows = []
+
+    # an OPML file with (count) feeds in up to 10 groups
+    myFeeds = ida.FeedRegistry()
+    for n in range(count):
+        myFeeds.add_feed("Group " + str(n % 10), "Website " + str(n), ida.Feed(
+            base + "/feed/" + str(n), base + "/site/" + str(n)))
+    ida.write_OPML(myFeeds, "benchmark.opml")
+
+    def import_stage(times):
+        with timed_function("get_url_status", times):
+            return ida.OPML_feeds(list(ida.read_OPML("benchmark.opml")))[0]
+
+    row, myFeeds = benchmark_stage("import", count, import_stage)
+    rows.append(row)
+    ida.save_myFeeds(myFeeds)
+
+    # every feed is on the same host, so do not limit the number of requests per host
+    def check_stage(times):
+        with timed_function("fetch_feed", times):
+            return ida.find_all_changes(
+                myFeeds, per_host=ida.REFRESH_WORKERS, force=True, processes=processes)[2]
+
+    row, myFeeds = benchmark_stage("check", count, check_stage)
+    rows.append(row)
+    row, myFeeds = benchmark_stage("recheck", count, check_stage)
+    rows.append(row)
+
+    sites = [base + "/site/" + str(n) for n in range(min(count, BENCHMARK_SITES))]
+
+    def discover_stage(times):
+        for site in sites:
+            t = time.perf_counter()
+            ida.findfeed(site)
+            times.append(time.perf_counter() - t)
+
+    rows.append(benchmark_stage("discover", len(sites), discover_stage)[0])
+
+    titles_read = ida.TitlesRead(ida.TITLES_READ_FILE)
+
+    def list_stage(times):
+        for i in range(BENCHMARK_LISTINGS):
+            t = time.perf_counter()
+            ida.print_feeds(myFeeds, False, titles_read)
+            times.append(time.perf_counter() - t)
+
+    row = benchmark_stage("list", count, list_stage)[0]
+    # count every feed listed
+    row[2] *= BENCHMARK_LISTINGS
+    rows.append(row)
+
+    return rows
+
+
+def benchmark_stage(name, count, stage):
+    """
+    Utility for benchmark(): run stage([times]) with everything ida prints hidden. The stage appends the time of each download (or listing) to [times]. Returns the row [name, count, items handled, seconds, times, peak memory in bytes] and whatever the stage returned.
+    """
+    times = []
+    tracemalloc.start()
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = stage(times)
+    seconds = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return [name, count, count, seconds, times, peak], result
+
+
+def print_benchmark_row(row):
+    """
+    Utility for benchmark(): print one row of results.
+    """
+    name, count, items, seconds, times, peak = row
+    times = sorted(times)
+
+    def percentile(p):
+        if not times:
+            return 0
+        return times[min(len(times) - 1, int(len(times) * p / 100))] * 1000
+
+    print("{:<9} {:>6} {:>9.2f} {:>9.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+        name, count, seconds, items / seconds if seconds else 0,
+        percentile(50), percentile(90), percentile(99), peak / 1024 / 1024))
+
+    return None
+
+
+@contextlib.contextmanager
+def timed_function(name, times):
+    """
+    Utility for benchmark(): inside the "with" block, every call to the function (name) in ida is timed, and its time appended to [times]. It works for calls made from other threads too.
+    """
+    function = getattr(ida, name)
+
+    def timed(*args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            times.append(time.perf_counter() - t)
+
+    setattr(ida, name, timed)
+    try:
+        yield
+    finally:
+        setattr(ida, name, function)
+
+
+def benchmark_arguments(args):
+    """
+    Utility to read the command line arguments: numbers of feeds, then optionally --latency SECONDS, --entries N, --size BYTES and --processes N. Returns the arguments for benchmark().
+    """
+    feed_counts = []
+    options = {
+        "--latency": BENCHMARK_LATENCY,
+        "--entries": BENCHMARK_ENTRIES,
+        "--size": BENCHMARK_ENTRY_SIZE,
+        "--processes": ida.PARSE_PROCESSES,
+    }
+    args = iter(args)
+    for arg in args:
+        if arg in options:
+            options[arg] = type(options[arg])(next(args, ""))
+        else:
+            feed_counts.append(int(arg))
+
+    return (
+        feed_counts or BENCHMARK_FEEDS,
+        options["--latency"],
+        options["--entries"],
+        options["--size"],
+        options["--processes"],
+    )
+
+
+if __name__ == "__main__":
+
+    benchmark(*benchmark_arguments(argv[1:]))
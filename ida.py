@@ -18,19 +18,67 @@ Simple news aggregator:
     Source: https://www.youtube.com/watch?v=ZRlbf5P2iMA
 """
 
+import argparse
+import bisect
+import calendar
+import contextlib
 import hashlib
+import importlib
 import json
+import mmap
+import multiprocessing
+import os
 import re
+import sqlite3
+import statistics
 import textwrap
+import threading
+import time
 import urllib.parse
 import webbrowser
+import xml.etree.ElementTree as ET
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from inspect import getfullargspec, getmembers, isfunction
-from sys import modules
+from sys import argv, modules, stderr, stdout
 
-import feedparser
-import requests
-from bs4 import BeautifulSoup as bs4
+# time when ida started; see print_startup_times()
+ida_start = time.perf_counter()
+
+# {step: seconds} for the steps of starting ida, and for each heavy module imported
+startup_times = {}
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported the first time one of its attributes is used. feedparser, requests and bs4 (with lxml) are slow to import and are needed only to go online, so reading articles that have already been fetched never imports them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def load(self):
+        """
+        Import the module now, if it has not been imported yet, and return it.
+        """
+        if self.module is None:
+            t = time.perf_counter()
+            self.module = importlib.import_module(self.name)
+            startup_times["import " + self.name] = time.perf_counter() - t
+        return self.module
+
+
+feedparser = LazyModule("feedparser")
+requests = LazyModule("requests")
+bs4 = LazyModule("bs4")
 
 """
 === DATA STRUCTURES ==============
@@ -52,21 +100,93 @@ myFeeds = {
     ]
 }
 
+{myFeeds} is a FeedRegistry, which also keeps an index of its feeds by id, title, and RSS address.
+
 
 updated_feeds = [{feed title: [
                         0: feed RSS
                         1: updated? (boolean)
-                        2: [most recent post title, most recent post link]
-                        3: [title, link]
+                        2: Article(most recent post title, most recent post link)
+                        3: Article(title, link)
                         4: ...
                         ]
                     }
                 {feed title: [],}
             ]
 
+
+bad_feeds = [{feed title: [
+                    0: feed RSS
+                    1: what went wrong (e.g., "ConnectTimeout", "HTTP 404")
+                    ]
+                }
+            ]
+
 =================================
 """
 
+# === SETTINGS ==============
+
+# maximum number of feeds that find_all_changes() fetches at the same time
+REFRESH_WORKERS = 16
+
+# maximum number of simultaneous requests that find_all_changes() sends to one host
+REFRESH_PER_HOST = 4
+
+# SQLite database that holds {myFeeds} and the article store
+DB_FILE = "ida.db"
+
+# binary file that holds {titles_read}
+TITLES_READ_FILE = "titles_read.bin"
+
+# number of posts kept in the article store for each feed
+ARTICLES_PER_FEED = 500
+
+# number of posts read from a feed at each check, and number of posts in a row already in the article store after which the rest of the feed is not read
+FEED_ENTRY_LIMIT = 100
+FEED_KNOWN_RUN = 3
+
+# number of bytes of a feed read at a time by stream_feed()
+FEED_CHUNK_SIZE = 16 * 1024
+
+# number of processes that parse feeds during "<c>heck feeds", so that every core is used, and the least number of feeds due to be checked for them to be worth starting (0 processes: parse in the threads that download)
+PARSE_PROCESSES = os.cpu_count() or 1
+PARSE_PROCESS_MIN_FEEDS = 200
+
+# number of downloads of each feed kept in the fetch metrics
+FETCHES_PER_FEED = 20
+
+# shortest and longest time, in seconds, between two checks of a feed by "<c>heck feeds"
+SCHEDULE_MIN_INTERVAL = 60 * 60
+SCHEDULE_MAX_INTERVAL = 24 * 60 * 60
+
+# seconds between two rounds of checking feeds when ida runs with --daemon
+DAEMON_INTERVAL = 10 * 60
+
+# seconds to wait for a website to respond before giving up
+HTTP_TIMEOUT = 30
+
+# SQLite database that holds downloaded web pages and feeds, and its maximum size in bytes
+HTTP_CACHE_FILE = "http_cache.db"
+HTTP_CACHE_SIZE = 50 * 1024 * 1024
+
+# number of cached responses found before the times they were used are written to the HTTP cache (see cache_lookup())
+HTTP_CACHE_USED_BATCH = 100
+
+# seconds to wait for a website when import_OPML() checks that its link is valid
+LINK_CHECK_TIMEOUT = 10
+
+# seconds that add_feed() spends looking for the RSS address of a website
+DISCOVERY_DEADLINE = 20
+
+# number of bytes at the start of a link that findfeed() looks at before deciding whether to download the whole link
+FEED_SNIFF_BYTES = 2048
+
+# set the headers like we are a browser
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36"
+}
+
 
 # === DEVELOPER UTILITY FUNCTIONS ================
 
@@ -80,7 +200,7 @@ def get_feed_info(rss):
         rss = input("RSS address: ")
 
     try:
-        newsfeed = feedparser.parse(rss)
+        newsfeed = fetch_feed(rss)
         # ['entries'] is the only dict in [newsfeed_keys]
         newsfeed_keys = [
             "feed",
@@ -192,6 +312,18 @@ def get_feed_info(rss):
     return
 
 
+def print_startup_times():
+    """
+    Print how long each step of starting ida took, and how long each heavy module took to import (if it has been imported yet). Shown at startup with "python ida.py --timing".
+    """
+    print("=" * 14, " STARTUP TIMES ", "=" * 14, sep="")
+    for step, seconds in startup_times.items():
+        print("{:>8.1f} ms  {}".format(seconds * 1000, step))
+    print("=" * 43)
+
+    return
+
+
 def print_all_functions():
     """
     Print all the functions, with their docStrings, used in this program. USED ONLY BY THE DEVELOPER.
@@ -226,125 +358,663 @@ def print_all_functions():
     return
 
 
+# === NETWORK ================
+
+http_session = None
+http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Return the one requests.Session shared by every download. Connections are kept alive and reused, so feeds on the same host need only one TCP/TLS handshake (and one DNS lookup) per connection instead of one per request.
+    """
+    global http_session
+
+    with http_session_lock:
+        if http_session is None:
+            http_session = requests.Session()
+            http_session.headers.update(HTTP_HEADERS)
+            # keep up to REFRESH_WORKERS open connections for each of up to 100 hosts
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=100, pool_maxsize=max(REFRESH_WORKERS, 10)
+            )
+            http_session.mount("http://", adapter)
+            http_session.mount("https://", adapter)
+
+    return http_session
+
+
+def http_get(url, headers=None, timeout=HTTP_TIMEOUT, stream=False):
+    """
+    Download (url) through the shared connection pool and return the requests.Response. Every download in ida goes through this function. With (stream), only the headers are read until the caller reads the content.
+
+    Responses are kept in the HTTP cache (http_cache.db):
+    - a response that is still fresh (Cache-Control max-age or Expires) is returned without asking the website
+    - a stale response is revalidated with its ETag / Last-Modified; if the website answers "304 Not Modified", the cached response is returned
+    - if the caller sent its own ETag / Last-Modified and they match a fresh cached response, a 304 response is returned
+    """
+    headers = dict(headers or {})
+    conditional = "If-None-Match" in headers or "If-Modified-Since" in headers
+
+    entry = cache_lookup(url)
+    revalidating = False
+    if entry:
+        final_url, cached_headers, content, expires = entry
+        if time.time() < expires:
+            if conditional and (
+                headers.get("If-None-Match") == cached_headers.get("ETag", "")
+                or headers.get("If-Modified-Since") == cached_headers.get("Last-Modified", "")
+            ):
+                return cached_response(final_url, 304, cached_headers, b"")
+            return cached_response(final_url, 200, cached_headers, content)
+        if not conditional:
+            if cached_headers.get("ETag"):
+                headers["If-None-Match"] = cached_headers["ETag"]
+            if cached_headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+            revalidating = "If-None-Match" in headers or "If-Modified-Since" in headers
+
+    r = get_http_session().get(
+        url, headers=headers, timeout=timeout, stream=stream)
+
+    if r.status_code == 304 and entry:
+        # the cached response is still good; the 304 may carry a new expiry date
+        cached_headers.update(r.headers)
+        cache_store(url, final_url, cached_headers, content)
+        if revalidating:
+            return cached_response(final_url, 200, cached_headers, content)
+    elif r.status_code == 200 and not stream and "Range" not in headers:
+        cache_store(url, r.url, r.headers, r.content)
+
+    return r
+
+
+def http_head(url, timeout=HTTP_TIMEOUT):
+    """
+    Send a HEAD request for (url) through the shared connection pool, following redirects, and return the requests.Response. If the HTTP cache holds a fresh response for (url), that is returned instead.
+    """
+    entry = cache_lookup(url)
+    if entry and time.time() < entry[3]:
+        return cached_response(entry[0], 200, entry[1], b"")
+
+    return get_http_session().head(url, timeout=timeout, allow_redirects=True)
+
+
+# === HTTP CACHE ================
+
+"""
+http_cache.db holds two tables:
+
+responses: url, size, expires, used (time of last use), final_url (after redirects), headers (JSON), content
+cache_size: total (the sum of the sizes of all responses, kept up to date by cache_store())
+
+When the cache grows beyond HTTP_CACHE_SIZE bytes, the least recently used responses are thrown away. The small columns come before content, so that reading them never reads the content as well.
+
+Finding a response in the cache writes nothing: the time it was used is kept in {cache_used} and written with the next response stored, or once there are HTTP_CACHE_USED_BATCH of them.
+"""
+http_cache = threading.local()
+
+# {url: time of last use} of cached responses, not yet written to http_cache.db
+cache_used = {}
+cache_used_lock = threading.Lock()
+
+
+def get_cache_db():
+    """
+    Return this thread's connection to the HTTP cache, creating the table the first time. Every thread has its own connection because downloads run in many threads at once.
+    """
+    db = getattr(http_cache, "db", None)
+    if db is None:
+        db = sqlite3.connect(HTTP_CACHE_FILE, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        # version 1: small columns before content, and the cache_size table; an older cache is simply thrown away
+        if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+            db.execute("DROP TABLE IF EXISTS responses")
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                used REAL NOT NULL,
+                final_url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                content BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+            CREATE TABLE IF NOT EXISTS cache_size (total INTEGER NOT NULL);
+            INSERT INTO cache_size SELECT (SELECT COALESCE(SUM(size), 0) FROM responses)
+                WHERE NOT EXISTS (SELECT 1 FROM cache_size);
+            PRAGMA user_version = 1;
+            """
+        )
+        http_cache.db = db
+
+    return db
+
+
+def cache_lookup(url):
+    """
+    Return (final url, headers, content, expires) for a cached response to (url), or None if there is none.
+    """
+    try:
+        db = get_cache_db()
+        row = db.execute(
+            "SELECT final_url, headers, content, expires FROM responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        with cache_used_lock:
+            cache_used[url] = time.time()
+            flush = len(cache_used) >= HTTP_CACHE_USED_BATCH
+        if flush:
+            with db:
+                write_cache_used(db)
+    except sqlite3.Error:
+        # a cache that cannot be read is the same as an empty cache
+        return None
+
+    final_url, headers, content, expires = row
+    return final_url, requests.structures.CaseInsensitiveDict(json.loads(headers)), content, expires
+
+
+def cache_store(url, final_url, headers, content):
+    """
+    Put a response in the HTTP cache, if its headers allow it to be cached, and keep the cache under HTTP_CACHE_SIZE bytes.
+    """
+    now = time.time()
+    expires = cache_expires(headers, now)
+    if expires is None:
+        return None
+    if expires <= now and not (headers.get("ETag") or headers.get("Last-Modified")):
+        # never fresh and cannot be revalidated, so there is no point keeping it
+        return None
+    if len(content) > HTTP_CACHE_SIZE:
+        return None
+
+    try:
+        db = get_cache_db()
+        with db:
+            write_cache_used(db)
+            old = db.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, len(content), expires, now, final_url,
+                 json.dumps(dict(headers)), content),
+            )
+            db.execute(
+                "UPDATE cache_size SET total = total + ?",
+                (len(content) - (old[0] if old else 0),),
+            )
+            total = db.execute("SELECT total FROM cache_size").fetchone()[0]
+            if total > HTTP_CACHE_SIZE:
+                # throw away the least recently used responses
+                for old_url, size in db.execute(
+                    "SELECT url, size FROM responses ORDER BY used"
+                ).fetchall():
+                    if total <= HTTP_CACHE_SIZE:
+                        break
+                    db.execute("DELETE FROM responses WHERE url = ?", (old_url,))
+                    total -= size
+                db.execute("UPDATE cache_size SET total = ?", (total,))
+    except sqlite3.Error:
+        pass
+
+    return None
+
+
+def write_cache_used(db):
+    """
+    Utility to write the times in {cache_used} to the HTTP cache, inside a transaction of (db). Used by cache_lookup() and cache_store().
+    """
+    with cache_used_lock:
+        used = [(t, url) for url, t in cache_used.items()]
+        cache_used.clear()
+    db.executemany("UPDATE responses SET used = ? WHERE url = ?", used)
+
+    return None
+
+
+def cache_expires(headers, now):
+    """
+    Work out from Cache-Control, Age and Expires headers when a response stops being fresh. Returns None if the response must not be stored at all.
+    """
+    directives = {}
+    for d in headers.get("Cache-Control", "").lower().split(","):
+        if d.strip():
+            k, _, v = d.partition("=")
+            directives[k.strip()] = v.strip().strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return now
+    if "max-age" in directives:
+        try:
+            max_age = int(directives["max-age"])
+            age = int(headers.get("Age", 0))
+        except ValueError:
+            return now
+        return now + max(0, max_age - age)
+    if headers.get("Expires"):
+        try:
+            return parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            # an invalid Expires header means "already expired"
+            return now
+
+    return now
+
+
+def cached_response(url, status_code, headers, content):
+    """
+    Utility to turn a cached response into a requests.Response, so callers of http_get() cannot tell the difference.
+    """
+    r = requests.Response()
+    r.url = url
+    r.status_code = status_code
+    r.headers = requests.structures.CaseInsensitiveDict(headers)
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r._content = content
+    r._content_consumed = True
+    # lets callers (e.g., fetch_feed()) tell that no content was downloaded
+    r.from_cache = True
+
+    return r
+
+
 # === IMPORT OPML FILE ================
 
 
 def import_OPML(myFeeds):
     """
-    Parse an OPML file and put group names, feed titles, and feed addresses in {myFeeds} in the form {'Group': [{feed title: [0: feed RSS, 1: feed URL, 2: feed.ETag, 3: feed.modified, 4: changed/unchanged, 5: title of last entry posted on website, 6: link to last entry posted on website]}]}. If no filename is entered, process is aborted. If FileNotFoundError is generated, notify user and <continue>. With confirmation, this file is overwritten each time an OPML file is read.
+    Parse an OPML file and put group names, feed titles, and feed addresses in {myFeeds} in the form {'Group': [{feed title: [0: feed RSS, 1: feed URL, 2: feed.ETag, 3: feed.modified, 4: changed/unchanged, 5: title of last entry posted on website, 6: link to last entry posted on website]}]}. If no filename is entered, process is aborted. If FileNotFoundError is generated, notify user and <continue>. With confirmation, all feeds are replaced each time an OPML file is read.
 
-    Output: {myFeeds} is written to myFeeds.json.
+    Output: {myFeeds} is saved to the database (ida.db).
     """
+    old_feeds = myFeeds
 
     while True:
         print()
-        # get the name of the OPML file and put each line in a [list]
+        # get the name of the OPML file and read the feeds in it
         file = input("Name of OPML file to import: ")
         if file:
             try:
-                with open(file, "r") as f:
-                    feedly = f.readlines()
+                new_feeds = list(read_OPML(file))
             except FileNotFoundError:
                 err = file + " not found."
                 return err, myFeeds
+            except ET.ParseError:
+                err = file + " is not a valid OPML file."
+                return err, myFeeds
 
-            # extract group name from line
-            rem_Feed_Group = re.compile(
-                r"""
-                        (.*<outline\stext=\")(?P<Feed_Group>\w*\s*\w*)
-                        """,
-                re.X,
-            )
-            # extract site title from the line
-            rem_title = re.compile(
-                r"""
-                        (.*)(<outline.*text=\")(?P<Feed_Title>.*)(\"\stitle)
-                        """,
-                re.X,
-            )
-
-            # extract the RSS address from the line
-            rem_RSS = re.compile(
-                r"""
-                            (.xmlUrl=\")(?P<RSS>.*)(\"\s)
-                            """,
-                re.X,
-            )
-
-            # extract HTML address from the line
-            rem_HTML = re.compile(
-                r"""
-                            (.*htmlUrl=")(?P<URL>.*\")
-                            """,
-                re.X,
-            )
+            print("\nChecking", len(new_feeds), "links...")
+            myFeeds, bad_links = OPML_feeds(new_feeds)
 
-            # put group, title, and RSS in {myFeeds}
-            myFeeds = {"Default": {}}
-            for ndx, line in enumerate(feedly):
-                m_Feed_Group = re.search(rem_Feed_Group, line)
-                m_Feed_Title = re.search(rem_title, line)
-                m_RSS = re.search(rem_RSS, line)
-                m_HTML = re.search(rem_HTML, line)
-                if m_HTML:
-                    this_URL = m_HTML.group("URL")[:-1]  # deletes the final "
-                    # check to see if this is a valid URL
-                    print("Checking if link is valid:", this_URL)
-                    status_code = get_url_status(this_URL)
-                    if status_code != 200:
-                        continue
-                if m_Feed_Group:
-                    this_group = m_Feed_Group.group("Feed_Group")
-                    myFeeds.update({this_group: {}})
-                if m_Feed_Title:
-                    this_title = m_Feed_Title.group("Feed_Title")
-                if m_RSS:
-                    this_RSS = m_RSS.group("RSS")
-                if m_Feed_Title and m_RSS and m_HTML:
-                    # add placeholders for feed.ETag, feed.modified, feed.updated, feed.last_title, feed.last_link
-                    new_feed = {this_title: [
-                        this_RSS, this_URL, "", "", "", "", ""]}
-
-                    myFeeds[this_group].update(new_feed)
+            print(len(new_feeds) - len(bad_links), " of ",
+                  len(new_feeds), " links are valid.", sep="")
+            if bad_links:
+                print()
+                print("=" * 5, " NOT IMPORTED ", "=" * 5, sep="")
+                for this_title, this_URL, status_code in bad_links:
+                    print(this_title, " (", status_code, "): ", this_URL, sep="")
+                print("=" * 24, sep="")
+            print()
             break
         else:
             # if no file name was entered by user
             err = "Aborted."
             return err, myFeeds
 
-    # with confirmation, write {myFeeds} to myFeeds.json
-    r = input('Overwrite "myFeeds.json"? (YES/ABORT) ')
+    # with confirmation, replace all feeds with the imported feeds
+    r = input("Replace all of your feeds? (YES/ABORT) ")
     if r.upper() == "YES":
-        with open("myFeeds.json", "w+") as file:
-            file.write(json.dumps(myFeeds, ensure_ascii=False))
         err = ""
     else:
         err = "Aborted."
+        return err, old_feeds
 
-    myFeeds = clean_feeds(myFeeds)
+    myFeeds = clean_feeds(myFeeds)  # clean_feeds() also saves {myFeeds}
 
     return err, myFeeds
 
 
-def get_url_status(url):
+def OPML_feeds(new_feeds):
+    """
+    Turn the feeds read by read_OPML() into {myFeeds}, leaving out feeds whose link is not valid. Returns {myFeeds} and [bad_links], a list of [feed title, link, status code].
+    """
+    # check that every link is valid, all at the same time; feeds without a website link are checked by their RSS address
+    status_codes = get_url_statuses([i[3] or i[2] for i in new_feeds])
+
+    # put group, title, and RSS in {myFeeds}
+    myFeeds = FeedRegistry({"Default": {}})
+    bad_links = []
+    for (this_group, this_title, this_RSS, this_URL), status_code in zip(
+        new_feeds, status_codes
+    ):
+        if status_code != 200:
+            bad_links.append([this_title, this_URL or this_RSS, status_code])
+            continue
+        # add placeholders for feed.ETag, feed.modified, feed.updated, feed.last_title, feed.last_link
+        myFeeds.add_feed(this_group, this_title, Feed(this_RSS, this_URL))
+
+    return myFeeds, bad_links
+
+
+def read_OPML(file):
+    """
+    Read an OPML file as a stream and yield [group, feed title, feed RSS, feed URL] for each feed in it. Attributes may be in any order and outlines may span several lines. A feed belongs to the nearest outline around it that is not itself a feed; feeds outside any group go into "Default". Each outline is thrown away once it has been read, so very large files use little memory.
+    """
+    groups = []
+    # the elements that have been opened but not yet closed, so that a finished outline can be taken out of its parent
+    parents = []
+    for event, elem in ET.iterparse(file, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+        else:
+            parents.pop()
+        if elem.tag != "outline":
+            continue
+
+        rss = elem.get("xmlUrl", "")
+        title = elem.get("title") or elem.get("text") or ""
+        if event == "start":
+            if not rss:
+                groups.append(title or "Default")
+            else:
+                group = groups[-1] if groups else "Default"
+                yield [group, title or rss, rss, elem.get("htmlUrl", "")]
+        else:
+            if not rss:
+                groups.pop()
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+
+    return
+
+
+def export_OPML(myFeeds):
+    """
+    Write {myFeeds} to an OPML file, one outline for each group with an outline for each of its feeds. The file can be read again by import_OPML().
+    """
+    print()
+    file = input("Name of OPML file to export: ")
+    if not file:
+        err = "Aborted."
+        return err
+
+    try:
+        write_OPML(myFeeds, file)
+    except OSError:
+        err = "Could not write " + file + "."
+        return err
+
+    err = ""
+    return err
+
+
+def write_OPML(myFeeds, file):
+    """
+    Utility to write {myFeeds} to the OPML file (file). Used by export_OPML().
+    """
+    opml = ET.Element("opml", version="1.0")
+    head = ET.SubElement(opml, "head")
+    ET.SubElement(head, "title").text = "ida feeds"
+    body = ET.SubElement(opml, "body")
+    for group, feeds in myFeeds.items():
+        if not feeds:
+            continue
+        grp = ET.SubElement(body, "outline", text=group, title=group)
+        for feed_title, feed_info in feeds.items():
+            ET.SubElement(
+                grp,
+                "outline",
+                type="rss",
+                text=feed_title,
+                title=feed_title,
+                xmlUrl=feed_info.rss,
+                htmlUrl=feed_info.url,
+            )
+
+    tree = ET.ElementTree(opml)
+    # ET.indent() is not available before python 3.9
+    if hasattr(ET, "indent"):
+        ET.indent(tree)
+    tree.write(file, encoding="utf-8", xml_declaration=True)
+
+    return None
+
+
+def get_url_status(url, timeout=LINK_CHECK_TIMEOUT):
     """
     Get the status code for a URL. This function is used by import_OPML() to be sure each feed is accessible.
+
+    A HEAD request is tried first. Some servers do not answer HEAD requests properly, so if it fails, a GET request is sent, but its content is never downloaded. Returns "no connection" if the website cannot be reached.
     """
-    # set the headers like we are a browser
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36"
-    }
-    # download the url and get its status, if any
     try:
-        r = requests.get(url, headers=headers)
-        status_code = r.status_code
+        status_code = http_head(url, timeout).status_code
+        if status_code != 200:
+            with http_get(url, timeout=timeout, stream=True) as r:
+                status_code = r.status_code
     except:
-        print("Cannot connect to", url, "\nstatus code: ", status_code, sep="")
-        status_code = 404
+        status_code = "no connection"
 
     return status_code
 
 
+def get_url_statuses(urls, workers=REFRESH_WORKERS):
+    """
+    Get the status codes for a list of URLs, checking up to (workers) URLs at the same time. Status codes are returned in the same order as [urls].
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        status_codes = list(pool.map(get_url_status, urls))
+
+    return status_codes
+
+
+# === FEED REGISTRY ================
+
+
+class Feed:
+    """
+    The feed info of one feed in {myFeeds}. It takes much less memory than the list that earlier versions of ida kept. It is saved in ida.db and myFeeds.json as that list (see to_list()):
+
+    0: rss          feed RSS
+    1: url          feed URL
+    2: etag         feed.ETag
+    3: modified     feed.modified
+    4: status       changed/unchanged
+    5: last_title   title of last entry posted on website
+    6: last_link    link to last entry posted on website
+    """
+
+    __slots__ = ("rss", "url", "etag", "modified", "status", "last_title", "last_link")
+
+    def __init__(self, rss="", url="", etag="", modified="", status="", last_title="", last_link=""):
+        self.rss = rss
+        self.url = url
+        self.etag = etag
+        self.modified = modified
+        self.status = status
+        self.last_title = last_title
+        self.last_link = last_link
+
+    def __repr__(self):
+        return "Feed(" + ", ".join(repr(v) for v in self.to_list()) + ")"
+
+    def to_list(self):
+        """
+        Return the feed info as a list, as saved in ida.db and myFeeds.json.
+        """
+        return [getattr(self, k) for k in self.__slots__]
+
+    @classmethod
+    def from_list(cls, feed_info):
+        """
+        Make a Feed from a list saved in ida.db or myFeeds.json.
+        """
+        return cls(*feed_info[: len(cls.__slots__)])
+
+
+class Article:
+    """
+    One post of a feed, as listed in [updated_feeds] and {chosen_feed}: a title and a link. Like Feed, it takes the place of the list [title, link] that earlier versions of ida kept.
+    """
+
+    __slots__ = ("title", "link")
+
+    def __init__(self, title="", link=""):
+        self.title = title
+        self.link = link
+
+    def __repr__(self):
+        return "Article(" + repr(self.title) + ", " + repr(self.link) + ")"
+
+
+class FeedRegistry(dict):
+    """
+    {myFeeds}: {group: {feed title: Feed}}, with indexes so that a feed can be found without walking every group:
+
+    feeds = {feed id: [group, feed title]}
+    titles = {feed title: feed id}
+    addresses = {RSS address: feed id}
+    order = [feed id, ...] in the order that print_feeds() numbers the feeds
+
+    Each feed gets an id when it is added, and keeps it when it is moved, renamed or edited, for as long as {myFeeds} is in memory. A feed title can be in only one group; adding a feed with a title that is already in {myFeeds} replaces that feed.
+
+    {myFeeds} can still be read like any other dict, but groups and feeds must be added, moved and removed with the methods below, so that the indexes stay right. [order] is rebuilt, the next time it is needed, only after a group or feed has been added, moved or removed.
+    """
+
+    def __init__(self, myFeeds=None):
+        super().__init__()
+        self.next_id = 1
+        self.feeds = {}
+        self.titles = {}
+        self.addresses = {}
+        self.order = None
+        for group, feeds in (myFeeds or {}).items():
+            self.add_group(group)
+            for feed_title, feed_info in (feeds or {}).items():
+                self.add_feed(group, feed_title, feed_info)
+
+    def add_group(self, group):
+        """
+        Add an empty group, unless it already exists.
+        """
+        if group not in self:
+            self[group] = {}
+
+    def remove_group(self, group):
+        """
+        Remove a group and every feed in it.
+        """
+        for feed_title in list(self[group]):
+            self.remove_feed(self.titles[feed_title])
+        del self[group]
+        self.order = None
+
+    def rename_group(self, group, new_name):
+        """
+        Rename a group. The renamed group goes to the end of {myFeeds}.
+        """
+        self[new_name] = self.pop(group)
+        for feed_title in self[new_name]:
+            self.feeds[self.titles[feed_title]][0] = new_name
+        self.order = None
+
+    def add_feed(self, group, feed_title, feed_info):
+        """
+        Add a feed (a Feed, or feed info as a list) to a group, creating the group if needed, and return its id.
+        """
+        if not isinstance(feed_info, Feed):
+            feed_info = Feed.from_list(feed_info)
+        if feed_title in self.titles:
+            feed_id = self.titles[feed_title]
+            self.remove_feed(feed_id)
+        else:
+            feed_id = self.next_id
+            self.next_id += 1
+
+        self.add_group(group)
+        self[group][feed_title] = feed_info
+        self.feeds[feed_id] = [group, feed_title]
+        self.titles[feed_title] = feed_id
+        if feed_info.rss:
+            self.addresses[feed_info.rss] = feed_id
+        self.order = None
+
+        return feed_id
+
+    def remove_feed(self, feed_id):
+        """
+        Remove a feed and return its feed info.
+        """
+        group, feed_title = self.feeds.pop(feed_id)
+        feed_info = self[group].pop(feed_title)
+        del self.titles[feed_title]
+        if self.addresses.get(feed_info.rss) == feed_id:
+            del self.addresses[feed_info.rss]
+        self.order = None
+
+        return feed_info
+
+    def move_feed(self, feed_id, group):
+        """
+        Move a feed to the end of another group, creating the group if needed.
+        """
+        old_group, feed_title = self.feeds[feed_id]
+        feed_info = self[old_group].pop(feed_title)
+        self.add_group(group)
+        self[group][feed_title] = feed_info
+        self.feeds[feed_id][0] = group
+        self.order = None
+
+    def set_address(self, feed_id, rss_address):
+        """
+        Give a feed a new RSS address, forgetting the ETag and modified date of the old one.
+        """
+        feed_info = self.info(feed_id)
+        if self.addresses.get(feed_info.rss) == feed_id:
+            del self.addresses[feed_info.rss]
+        feed_info.rss, feed_info.etag, feed_info.modified = rss_address, "", ""
+        if rss_address:
+            self.addresses[rss_address] = feed_id
+
+    def info(self, feed_id):
+        """
+        Return the Feed with this id.
+        """
+        group, feed_title = self.feeds[feed_id]
+        return self[group][feed_title]
+
+    def find(self, key):
+        """
+        Return the id of the feed with this title or RSS address, or None.
+        """
+        feed_id = self.titles.get(key)
+        if feed_id is None:
+            feed_id = self.addresses.get(key)
+        return feed_id
+
+    def number(self, n):
+        """
+        Return the id of the feed that print_feeds() shows as number (n), or None.
+        """
+        if self.order is None:
+            self.order = [
+                self.titles[feed_title]
+                for feeds in self.values()
+                for feed_title in feeds
+            ]
+        if 1 <= n <= len(self.order):
+            return self.order[n - 1]
+        return None
+
+
 # === FEED MANAGEMENT ================
 
 
@@ -360,28 +1030,13 @@ def add_feed(myFeeds):
     # enter a URL, find the feed address, parse the feed
     f = input("Website address: ")
 
+    if not urllib.parse.urlparse(f).scheme:
+        err = 'Did you forget "http://"?'
+        return myFeeds, err
+
     try:
         print("\nLooking for RSS address...")
-        result = findfeed(f)
-        # check alternate RSS formats
-        if not result:
-            result = findfeed(f + "/feed")
-        if not result:
-            result = findfeed(f + "/?feed=rss")
-        if not result:
-            result = findfeed(f + "/feed/rss2")
-        if not result:
-            result = findfeed(f + "/blog/feed")
-        if not result:
-            result = findfeed(f + "/atom.xml")
-        if not result:
-            result = feedburner_rss(f)
-        if not result and "youtube.com" in f:
-            result = youtube_rss(f)
-        if not result:
-            result = feed_xml(f + "/index.xml")
-        if not result:
-            result = ""
+        result = discover_feed(f)
     except:
         err = 'Did you forget "http://"?'
         return myFeeds, err
@@ -402,11 +1057,11 @@ def add_feed(myFeeds):
         rss_address = result
 
     if rss_address:
-        feed = feedparser.parse(rss_address)
+        feed = fetch_feed(rss_address)
     else:
         print("=" * 30, "\nNo RSS address found.\n", "=" * 30, "\n", sep="")
         rss_address = input("Enter RSS address manually: ")
-        feed = feedparser.parse(rss_address)
+        feed = fetch_feed(rss_address)
 
         if not rss_address or not feed["entries"]:
             print(
@@ -418,20 +1073,7 @@ def add_feed(myFeeds):
             )
             return myFeeds, err
 
-    # add info into {ew_feed}
-    """
-    new_feed = {feed title: [
-                        0: feed RSS
-                        1: feed URL
-                        2: feed.ETag
-                        3: feed.modified
-                        4: changed/unchanged
-                        5: title of last entry posted on website
-                        6: link to last entry posted on website
-                        ]
-                    }
-    """
-    new_feed = {}
+    # add info into a new Feed
     try:
         feed_title = feed["feed"]["title"]
     except:
@@ -450,10 +1092,7 @@ def add_feed(myFeeds):
     except:
         post_link = ""
 
-    new_feed.update(
-        {feed_title: [rss_address, URL, "", "",
-                      "unchanged", post_title, post_link]}
-    )
+    new_feed = Feed(rss_address, URL, "", "", "unchanged", post_title, post_link)
 
     # get the group that the feed should be added to...
     print("\nGroups:")
@@ -500,12 +1139,7 @@ def add_feed(myFeeds):
 
     # add {new_feed} to the appropriate group or create group if it doesn't exist
     if grp_name:
-        try:
-            # if the group already exists...
-            myFeeds[grp_name].update(new_feed)
-        except:
-            myFeeds.update({grp_name: {}})
-            myFeeds[grp_name].update(new_feed)
+        myFeeds.add_feed(grp_name, feed_title, new_feed)
 
     myFeeds = clean_feeds(myFeeds)
 
@@ -516,29 +1150,16 @@ def add_feed(myFeeds):
 
 def clean_feeds(myFeeds):
     """
-    Deletes feeds that are duplicates or that have no RSS address. The latter can happen when a user deletes a feed: del_feed() sets the RSS address to ''
+    Deletes feeds that have no RSS address, and groups that have no feeds (except "Default"). Duplicate feed titles cannot happen: {myFeeds} keeps only the last feed added with a title (see FeedRegistry).
     """
 
     # delete any feed with no RSS address
-    try:
-        for group, feeds in myFeeds.items():
-            for feed_title, feed_info in feeds.items():
-                if not feed_info[0]:
-                    feeds.pop(feed_title)
-                    continue
-    except:
-        pass
+    for feed_id in [i for i in myFeeds.feeds if not myFeeds.info(i).rss]:
+        myFeeds.remove_feed(feed_id)
 
     # find empty groups in {myFeeds} and delete them, excepting "Default"
-    # this will only work for one empty group at a time
-    for group, feeds in myFeeds.items():
-        if group == "Default":
-            continue
-        elif not myFeeds[group]:
-            myFeeds.pop(group)
-            break
-        else:
-            pass
+    for group in [g for g, feeds in myFeeds.items() if g != "Default" and not feeds]:
+        myFeeds.remove_group(group)
 
     save_myFeeds(myFeeds)
 
@@ -593,15 +1214,13 @@ def del_feed(myFeeds, titles_read):
             )
             continue
 
-    # find that name in {myFeeds} and set link to ''
-    ndx = 0
-    for group, feeds in myFeeds.items():
-        for feed_title, feed_info in feeds.items():
-            ndx += 1
-            if ndx == f:
-                confirming = input("Delete " + feed_title + "? (Y/N)").upper()
-                if confirming == 'Y':
-                    myFeeds[group][feed_title][0] = ""
+    # find that feed in {myFeeds} and delete it
+    feed_id = myFeeds.number(f) if f else None
+    if feed_id is not None:
+        feed_title = myFeeds.feeds[feed_id][1]
+        confirming = input("Delete " + feed_title + "? (Y/N)").upper()
+        if confirming == 'Y':
+            myFeeds.remove_feed(feed_id)
 
     print()
 
@@ -654,54 +1273,51 @@ def edit_RSS_address(myFeeds, titles_read):
             )
             continue
 
-    while True:
+    feed_id = myFeeds.number(f) if f else None
+    while feed_id is not None:
         r = input("Enter an RSS address: ")
         if not r:
             break
 
-        # find that name in {myFeeds} and set RSS_address to r
-        ndx, done = 0, False
-        for group, feeds in myFeeds.items():
-            for feed_title, feed_info in feeds.items():
-                ndx += 1
-                if ndx == f:
-                    print(
-                        "\nSetting RSS address for ",
-                        feed_title,
-                        " to\n",
-                        r,
-                        "\n",
-                        sep="",
-                    )
-                    ok = input("OK (Y/N)").upper()
-                    if ok == "Y":
-                        myFeeds[group][feed_title][0] = r
-                        print(
-                            "\n",
-                            "=" * 30,
-                            "\nRSS address for ",
-                            feed_title,
-                            "\nhas been set to:\n",
-                            r,
-                            "\n",
-                            "=" * 30,
-                            "\n",
-                            sep="",
-                        )
-                    else:
-                        print(
-                            "\n",
-                            "=" * 30,
-                            "\nRSS address for ",
-                            feed_title,
-                            "\nhas not been changed.\n",
-                            "=" * 30,
-                            "\n",
-                            sep="",
-                        )
-                    done = True
-        if done:
-            break
+        # set the RSS address of that feed to r
+        feed_title = myFeeds.feeds[feed_id][1]
+        print(
+            "\nSetting RSS address for ",
+            feed_title,
+            " to\n",
+            r,
+            "\n",
+            sep="",
+        )
+        ok = input("OK (Y/N)").upper()
+        if ok == "Y":
+            myFeeds.set_address(feed_id, r)
+            # the new address has never been checked, so it is due straight away
+            reset_schedule(feed_title)
+            print(
+                "\n",
+                "=" * 30,
+                "\nRSS address for ",
+                feed_title,
+                "\nhas been set to:\n",
+                r,
+                "\n",
+                "=" * 30,
+                "\n",
+                sep="",
+            )
+        else:
+            print(
+                "\n",
+                "=" * 30,
+                "\nRSS address for ",
+                feed_title,
+                "\nhas not been changed.\n",
+                "=" * 30,
+                "\n",
+                sep="",
+            )
+        break
 
     myFeeds = clean_feeds(myFeeds)
 
@@ -710,11 +1326,91 @@ def edit_RSS_address(myFeeds, titles_read):
     return myFeeds
 
 
+def discover_feed(f, deadline=DISCOVERY_DEADLINE):
+    """
+    Find the RSS address for a website (f). All of the usual places for a feed are tried at the same time: the website itself, /feed, /?feed=rss, /feed/rss2, /blog/feed, /atom.xml, feedburner, youtube, and /index.xml.
+
+    The answer is taken from the first place in that list that has a feed, as soon as every place before it has been tried. No more than REFRESH_PER_HOST requests are sent to the website at a time (see host_slot()). After (deadline) seconds, the best answer found so far is returned. Returns "" if no feed was found.
+    """
+    probes = [
+        (findfeed, f),
+        (findfeed, f + "/feed"),
+        (findfeed, f + "/?feed=rss"),
+        (findfeed, f + "/feed/rss2"),
+        (findfeed, f + "/blog/feed"),
+        (findfeed, f + "/atom.xml"),
+        (feedburner_rss, f),
+    ]
+    if "youtube.com" in f:
+        probes.append((youtube_rss, f))
+    probes.append((feed_xml, f + "/index.xml"))
+
+    pool = ThreadPoolExecutor(max_workers=len(probes))
+    futures = [pool.submit(func, arg) for func, arg in probes]
+    # None: still being tried; "" or []: no feed found there
+    results = [None] * len(futures)
+
+    result = ""
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            try:
+                results[futures.index(future)] = future.result() or ""
+            except:
+                results[futures.index(future)] = ""
+            result = best_discovery(results)
+            if result is not None:
+                break
+    except FuturesTimeoutError:
+        # out of time: take the best of the answers that did come back
+        result = best_discovery([r if r is not None else "" for r in results])
+
+    # don't wait for the slower places; their answers are no longer needed
+    for future in futures:
+        future.cancel()
+    pool.shutdown(wait=False)
+
+    return result or ""
+
+
+def best_discovery(results):
+    """
+    Utility for discover_feed(). Returns the first feed found in [results], None if a place before it has not answered yet, or "" if there is no feed anywhere.
+    """
+    for r in results:
+        if r is None:
+            return None
+        if r:
+            return r
+
+    return ""
+
+
+# {host: semaphore} for the requests sent by discover_feed(); see host_slot()
+discovery_hosts = {}
+discovery_hosts_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def host_slot(url, per_host=REFRESH_PER_HOST):
+    """
+    Utility that waits, inside the "with" block, until fewer than (per_host) requests of discover_feed() are being sent to the host of (url). All of the places that discover_feed() tries, and the links that findfeed() checks, are usually on the same website, which should not be flooded with requests, just as in find_all_changes().
+    """
+    host = urllib.parse.urlparse(url).hostname
+    with discovery_hosts_lock:
+        if host not in discovery_hosts:
+            discovery_hosts[host] = threading.BoundedSemaphore(per_host)
+        limit = discovery_hosts[host]
+
+    with limit:
+        yield
+
+
 def feed_xml(f):
     """
     Find a feed when the blog uses an xml address.
     """
-    feed = feedparser.parse(f)
+    with host_slot(f):
+        feed = fetch_feed(f)
     href = feed["href"] + "/index.xml"
     result = href if "error" not in feed["href"] else ""
     return result
@@ -724,7 +1420,8 @@ def feedburner_rss(f):
     """
     Find a feed when the blogger is using feedburner.
     """
-    feed = requests.get(f)
+    with host_slot(f):
+        feed = http_get(f)
     txt = feed.content.decode("utf-8")
 
     rem_uri = re.compile(
@@ -752,40 +1449,107 @@ def findfeed(site):
     Source: https://gist.github.com/alexmill/9bc634240531d81c3abe
     Attribution: https://alex.miller.im/
     """
-    raw = requests.get(site).text
+    with host_slot(site):
+        raw = http_get(site).text
     result = []
     possible_feeds = []
     try:
-        html = bs4(raw, features="lxml")
+        html = bs4.BeautifulSoup(raw, features="lxml")
     except:
         result = []
         return result
-    feed_urls = html.findAll("link", rel="alternate")
-    if len(feed_urls) > 1:
-        for f in feed_urls:
-            t = f.get("type", None)
-            if t:
-                if "rss" in t or "xml" in t:
-                    href = f.get("href", None)
-                    if href:
-                        possible_feeds.append(href)
-    parsed_url = urllib.parse.urlparse(site)
-    base = parsed_url.scheme + "://" + parsed_url.hostname
-    atags = html.findAll("a")
+    feed_urls = html.find_all("link", rel="alternate")
+    for f in feed_urls:
+        t = f.get("type", None)
+        if t:
+            if "rss" in t or "xml" in t:
+                href = f.get("href", None)
+                if href:
+                    possible_feeds.append(urllib.parse.urljoin(site, href))
+    atags = html.find_all("a")
     for a in atags:
         href = a.get("href", None)
         if href:
             if "xml" in href or "rss" in href or "feed" in href:
-                possible_feeds.append(base + href)
-    for url in list(set(possible_feeds)):
-        f = feedparser.parse(url)
-        if len(f.entries) > 0:
-            if url not in result:
-                result.append(url)
+                possible_feeds.append(urllib.parse.urljoin(site, href))
+    # check every possible feed at the same time
+    possible_feeds = list(dict.fromkeys(possible_feeds))
+    if possible_feeds:
+        with ThreadPoolExecutor(
+            max_workers=min(len(possible_feeds), REFRESH_WORKERS)
+        ) as pool:
+            feeds = list(pool.map(is_feed, possible_feeds))
+        for url, f in zip(possible_feeds, feeds):
+            if f:
+                if url not in result:
+                    result.append(url)
 
     return result
 
 
+# {url: Future of True/False}; the answers given by is_feed(), so no link is checked twice, even by threads that ask at the same time
+feed_checks = {}
+feed_checks_lock = threading.Lock()
+
+
+def is_feed(url):
+    """
+    Check whether (url) is a feed with at least one entry. Used by findfeed().
+
+    Checking is done in two steps so that links to ordinary web pages cost very little:
+    1. download only the first FEED_SNIFF_BYTES bytes and look at the content type and at the start of the document
+    2. only if that looks like RSS or Atom, download and parse the whole feed
+
+    The first thread to ask about (url) checks it; threads that ask while it is being checked wait for that answer.
+    """
+    with feed_checks_lock:
+        check = feed_checks.get(url)
+        first = check is None
+        if first:
+            check = feed_checks[url] = Future()
+
+    if not first:
+        return check.result()
+
+    ok = False
+    try:
+        ok = check_feed(url)
+    finally:
+        check.set_result(ok)
+
+    return ok
+
+
+def check_feed(url):
+    """
+    Utility for is_feed(): check (url) without looking at {feed_checks}.
+    """
+    try:
+        with host_slot(url), http_get(
+            url, headers={"Range": "bytes=0-" + str(FEED_SNIFF_BYTES - 1)}, stream=True
+        ) as r:
+            ok = r.status_code in (200, 206)
+            content_type = r.headers.get("Content-Type", "").lower()
+            first_bytes = next(r.iter_content(FEED_SNIFF_BYTES), b"").lower()
+    except:
+        ok = False
+
+    if ok:
+        looks_like_feed = any(
+            tag in first_bytes for tag in (b"<rss", b"<feed", b"<rdf:rdf"))
+        if not looks_like_feed and "html" not in content_type:
+            looks_like_feed = any(
+                t in content_type for t in ("rss", "atom", "xml"))
+        ok = looks_like_feed
+
+    if ok:
+        # one post is enough to know it is a feed
+        with host_slot(url):
+            ok = len(fetch_feed(url, limit=1).entries) > 0
+
+    return ok
+
+
 def move_feed(myFeeds, titles_read):
     """
     Move a feed to a different group.
@@ -834,46 +1598,22 @@ def move_feed(myFeeds, titles_read):
             )
             continue
 
-        # find that name in {myFeeds} and set title to ''
-        ndx = 0
-        for group, feeds in myFeeds.items():
-            for fd_ttl, feed_info in feeds.items():
-                ndx += 1
-                if ndx == f:
-                    print("  ", ndx, ": ", fd_ttl, sep="")
-                    this_feed = myFeeds[group][fd_ttl]
-                    feed_title = fd_ttl
-                    myFeeds[group][fd_ttl][0] = ""
-                    break
+        # find that feed in {myFeeds}
+        feed_id = myFeeds.number(f)
+        print("  ", f, ": ", myFeeds.feeds[feed_id][1], sep="")
 
         # enter the name of the group to receive the moving feed
         group_name = input("Enter name of group receiving feed: ").strip()
-        done = False
-
-        # find that name in {myFeeds} and set title to ''
-        ndx = 0
-        for group, feeds in myFeeds.items():
-            print(group)
-            if group == group_name:
-                try:
-                    # if the group already exists...
-                    myFeeds[group].update({feed_title: [this_feed]})
-                except:
-                    myFeeds.update({group_name: {}})
-                    myFeeds[group_name].update({feed_title: [this_feed]})
-
-        try:
-            # find the group in {myFeeds}
-            for k, v in myFeeds.items():
-                if k.upper() == group_name.upper():
-                    v.append(this_feed)
-                    done = True
-                    break
-            # in case user entered a garbage group, feed is moved to "Default" group
-            if not done:
-                myFeeds["Default"].append(this_feed)
-        except:
+        if not group_name:
             break
+
+        # find the group in {myFeeds}; in case user entered a garbage group, feed is moved to "Default" group
+        new_group = "Default"
+        for group in myFeeds:
+            if group.upper() == group_name.upper():
+                new_group = group
+                break
+        myFeeds.move_feed(feed_id, new_group)
         break
 
     myFeeds = clean_feeds(myFeeds)  # clean_feeds() also saves {myFeeds}
@@ -972,9 +1712,9 @@ def rename_group(myFeeds):
                   new_name + "? (Y/N) ").upper()
 
     if y == "Y":
-        myFeeds[new_name] = myFeeds.pop(this_feed)
+        myFeeds.rename_group(this_feed, new_name)
     elif y == "D":
-        myFeeds.pop(this_feed)
+        myFeeds.remove_group(this_feed)
     else:
         pass
 
@@ -1004,59 +1744,174 @@ def youtube_rss(f):
     return this_RSS
 
 
+# the tables in ida.db; see get_db()
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    grp TEXT NOT NULL,
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (grp, title)
+);
+CREATE TABLE IF NOT EXISTS articles (
+    feed TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    title TEXT NOT NULL,
+    link TEXT NOT NULL,
+    published TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    read INTEGER NOT NULL,
+    seen INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (feed, guid)
+);
+CREATE INDEX IF NOT EXISTS articles_feed_read ON articles (feed, read);
+CREATE INDEX IF NOT EXISTS articles_hash ON articles (hash);
+CREATE TABLE IF NOT EXISTS schedule (
+    feed TEXT PRIMARY KEY,
+    last_check REAL NOT NULL,
+    next_check REAL NOT NULL,
+    interval REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fetches (
+    feed TEXT NOT NULL,
+    time REAL NOT NULL,
+    status INTEGER NOT NULL,
+    cached INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    ttfb REAL NOT NULL,
+    download REAL NOT NULL,
+    parse REAL NOT NULL,
+    total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fetches_feed_time ON fetches (feed, time);
+"""
+
+# the database connection, and {myFeeds} as it was last loaded or saved
+db_connection = None
+saved_groups = {}
+saved_feeds = {}
+
+
 def save_myFeeds(myFeeds):
     """
-    Utility to save {myFeeds} to a file (myFeeds.json).
+    Utility to save {myFeeds} to the database (ida.db). Only groups and feeds that changed since the last save are written, all in one transaction, so a crash can never leave a half-saved file.
+    """
+    global saved_groups, saved_feeds
+
+    groups, feeds = myFeeds_rows(myFeeds)
+
+    db = get_db()
+    with db:
+        db.executemany(
+            "DELETE FROM groups WHERE name = ?",
+            [(g,) for g in saved_groups if g not in groups],
+        )
+        db.executemany(
+            "INSERT OR REPLACE INTO groups (name, position) VALUES (?, ?)",
+            [(g, pos) for g, pos in groups.items() if saved_groups.get(g) != pos],
+        )
+        db.executemany(
+            "DELETE FROM feeds WHERE grp = ? AND title = ?",
+            [k for k in saved_feeds if k not in feeds],
+        )
+        # posts, schedule and fetch metrics of a deleted feed are deleted too (but not those of a feed that moved to another group)
+        feed_titles = {k[1] for k in feeds}
+        deleted = {(k[1],) for k in saved_feeds if k[1] not in feed_titles}
+        db.executemany("DELETE FROM articles WHERE feed = ?", deleted)
+        db.executemany("DELETE FROM schedule WHERE feed = ?", deleted)
+        db.executemany("DELETE FROM fetches WHERE feed = ?", deleted)
+        db.executemany(
+            "INSERT OR REPLACE INTO feeds (grp, title, position, info) VALUES (?, ?, ?, ?)",
+            [
+                (k[0], k[1], v[0], v[1])
+                for k, v in feeds.items()
+                if saved_feeds.get(k) != v
+            ],
+        )
+
+    saved_groups, saved_feeds = groups, feeds
+
+    return None
+
+
+def save_feed_states(myFeeds):
     """
+    Utility to save only what checking the feeds changes in {myFeeds}: the ETag, modified date, status and most recent post of each feed. Used by daemon(), whose {myFeeds} was loaded at the start of a check that may have taken minutes.
 
-    with open("myFeeds.json", "w+") as file:
-        file.write(json.dumps(myFeeds, ensure_ascii=True))
+    Feeds are matched by title, in whatever group they are now. Feeds deleted, moved or renamed from the menu in the meantime, and groups changed there, are left as the menu saved them; a feed whose RSS address was edited keeps its new address and forgets nothing about the old one.
+    """
+    db = get_db()
+    with db:
+        # take the write lock before reading, so that the menu cannot save in between
+        db.execute("BEGIN IMMEDIATE")
+        stored = dict(db.execute("SELECT title, info FROM feeds"))
+        rows = []
+        for feeds in myFeeds.values():
+            for feed_title, feed_info in feeds.items():
+                info = stored.get(feed_title)
+                if info is None:
+                    continue
+                saved = Feed.from_list(json.loads(info))
+                if saved.rss != feed_info.rss:
+                    continue
+                saved.etag, saved.modified, saved.status = feed_info.etag, feed_info.modified, feed_info.status
+                saved.last_title, saved.last_link = feed_info.last_title, feed_info.last_link
+                new_info = json.dumps(saved.to_list(), ensure_ascii=False)
+                if new_info != info:
+                    rows.append((new_info, feed_title))
+        db.executemany("UPDATE feeds SET info = ? WHERE title = ?", rows)
 
     return None
 
 
+def myFeeds_rows(myFeeds):
+    """
+    Utility to turn {myFeeds} into the rows stored by save_myFeeds():
+
+    groups = {group: position}
+    feeds = {(group, feed title): (position in group, feed info as JSON)}
+    """
+    groups, feeds = {}, {}
+    for g_pos, (group, group_feeds) in enumerate(myFeeds.items()):
+        groups[group] = g_pos
+        if not group_feeds:
+            continue
+        for f_pos, (feed_title, feed_info) in enumerate(group_feeds.items()):
+            feeds[(group, feed_title)] = (
+                f_pos, json.dumps(feed_info.to_list(), ensure_ascii=False))
+
+    return groups, feeds
+
+
 # === CHECK FEEDS FOR UPDATES ================
 
 
 def print_feeds(myFeeds, show_read, titles_read):
     """
-    Print a numbered list of feeds, by group.
+    Print a numbered list of feeds, by group. A feed is flagged with "*" if it has changed or if it has unread articles.
     Used by: del_feed(), edit_rss_address(), move_feed(), list_updated_feeds()
+
+    Unread articles are counted by the unread article index, so drawing the list neither reads the article store nor hashes any links once the index has been built.
     """
-    # retrieve history.json from disk; this file contains [updated_feeds] from the last time the user ran "<c>heck feeds" from the main menu
-    try:
-        with open("history.json", "r", encoding="utf-8") as file:
-            updated_feeds = json.load(file)
-    except FileNotFoundError:
-        print('Run "<c>heck feeds" first.')
-        updated_feeds = []
-        return myFeeds, updated_feeds, titles_read
+    if unread_counts is None:
+        build_unread_index(titles_read)
 
     ndx = 0
     for group, feeds in myFeeds.items():
         print(group)
         for feed_title, feed_info in feeds.items():
             # see if all articles in feed have been read
-            for i in updated_feeds:
-                all_read = False
-                for k, v in i.items():
-                    if k == feed_title:
-                        cnt = 0
-                        for a in range(2, len(v)):
-                            cnt = (
-                                cnt + 1
-                                if hash_a_string(v[a][1]) in titles_read
-                                else cnt
-                            )
-                        if cnt == len(v) - 2:
-                            all_read = True
-                        break
-                if k == feed_title:
-                    break
+            all_read = unread_counts.get(feed_title, 0) == 0
             ndx += 1
-            if feed_info[4] == "unchanged" and not all_read:
+            if feed_info.status == "unchanged" and not all_read:
                 print(" *", ndx, ": ", feed_title, sep="")
-            elif feed_info[4] == "unchanged":
+            elif feed_info.status == "unchanged":
                 print("   ", ndx, ": ", feed_title, sep="")
             else:
                 print(" *", ndx, ": ", feed_title, sep="")
@@ -1064,9 +1919,17 @@ def print_feeds(myFeeds, show_read, titles_read):
     return ndx
 
 
-def find_all_changes(myFeeds):
+def find_all_changes(myFeeds, workers=REFRESH_WORKERS, per_host=REFRESH_PER_HOST, force=False, processes=PARSE_PROCESSES):
     """
     Go through the RSS feeds in {myFeeds} and return a list of feeds, with feeds being flagged that have changed since last access. Also return list of unreachable sites.
+
+    Feeds are downloaded concurrently by up to (workers) threads, with no more than (per_host) requests to any one host at a time. Results are processed in the same order as {myFeeds}, so [updated_feeds] and the article store are the same as for a one-at-a-time check.
+
+    Only feeds that are due, according to the refresh schedule, are downloaded; the others are treated as not modified. With (force), every feed is downloaded.
+
+    Each feed is read only up to its first FEED_ENTRY_LIMIT posts, or until it reaches posts already in the article store (see stream_feed()).
+
+    When at least PARSE_PROCESS_MIN_FEEDS feeds are due, the threads only download the feeds and (processes) processes parse them (see parse_feed()), so parsing is not limited to one core.
     """
     rss_list, updated_feeds, bad_feeds = [], [], []
 
@@ -1080,32 +1943,439 @@ def find_all_changes(myFeeds):
             # in case group is empty
             try:
                 feed_info = feeds[feed]  # value of the key (feed title)
-                rss_list.append([group, feed, feed_info[0]])
+                rss_list.append(
+                    [group, feed, feed_info.rss, feed_info.etag, feed_info.modified])
             except:
                 break
 
     """
     rss_list = [
-                [group, feed_title, rss_address]
+                [group, feed_title, rss_address, feed.ETag, feed.modified]
                 [...]
             ]
     """
 
-    for rss_feed in rss_list:
+    def fetch(rss_feed):
+        known = known_article_ids(rss_feed[1])
+        return fetch_feed(
+            rss_feed[2], rss_feed[3], rss_feed[4], known, FEED_ENTRY_LIMIT, parse_pool)
+
+    due = [force or is_feed_due(rss_feed[1]) for rss_feed in rss_list]
+    print(sum(due), " of ", len(rss_list), " feeds are due to be checked.\n", sep="")
+
+    # {host: deque of indexes in [rss_list]}: the due feeds waiting to be downloaded, by host
+    waiting = {}
+    for i, (rss_feed, d) in enumerate(zip(rss_list, due)):
+        if d:
+            host = urllib.parse.urlparse(rss_feed[2]).hostname
+            waiting.setdefault(host, deque()).append(i)
+
+    # starting processes takes a moment, so parse in the download threads when there are few feeds to check
+    if processes > 0 and sum(due) >= PARSE_PROCESS_MIN_FEEDS:
+        # "spawn" starts clean processes; forking a process that is running threads is not safe
+        parse_pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        parse_pool = None
+
+    # download all due feeds concurrently; a feed is handed to the pool only when its host has a free slot, so that no thread sits waiting for a busy host while feeds on other hosts wait in the queue
+    feed_updates = [None] * len(rss_list)
+    with parse_pool or contextlib.nullcontext():
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            # {future: (index in [rss_list], host)}
+            running = {}
+            for host, queue in waiting.items():
+                for _ in range(min(max(1, per_host), len(queue))):
+                    i = queue.popleft()
+                    running[pool.submit(fetch, rss_list[i])] = (i, host)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, host = running.pop(future)
+                    feed_updates[i] = future.result()
+                    if waiting[host]:
+                        j = waiting[host].popleft()
+                        running[pool.submit(fetch, rss_list[j])] = (j, host)
+
+    for rss_feed, feed_update, d in zip(rss_list, feed_updates, due):
+        if not d:
+            # a feed that is not due is handled as if its website answered "304 Not Modified"
+            feed_update = feedparser.FeedParserDict(
+                status=304, feed={}, entries=[], not_due=True)
         myFeeds, updated_feeds, bad_feeds = get_feed_status(
-            rss_feed, myFeeds, updated_feeds, bad_feeds
+            rss_feed, myFeeds, updated_feeds, bad_feeds, feed_update
         )
-
-    with open("history.json", "w+", encoding="utf-8") as file:
-        file.write(json.dumps(updated_feeds, ensure_ascii=False))
+        if d:
+            schedule_next_check(rss_feed[1], feed_update)
 
     print()
     return updated_feeds, bad_feeds, myFeeds
 
 
-def get_feed_status(rss_feed, myFeeds, updated_feeds, bad_feeds):
+def fetch_feed(rss_address, etag="", modified="", known=None, limit=None, parse_pool=None):
+    """
+    Download and parse one RSS feed. Used by find_all_changes() and get_feed_status().
+
+    If (etag) or (modified) are given, they are sent with the request (conditional GET). A server whose feed has not changed answers with status 304 and no entries.
+
+    The feed is downloaded through the shared connection pool (http_get()) and the bytes are handed to feedparser. Anything that is not a web address (e.g., a local file) is left to feedparser.
+
+    With (limit), the feed is parsed as it is downloaded (see stream_feed()), and downloading stops after (limit) posts, or once FEED_KNOWN_RUN posts in a row are in {known} (the guids of posts already in the article store). Only the title, link, id and dates of each post are read.
+
+    With (limit) and a (parse_pool) of processes, the feed is downloaded in full and parsed by parse_feed() in one of those processes, which hands back only the fields that are read.
+
+    How long the download took, and what went wrong, if anything, is returned in feed["metrics"] (see the FETCH METRICS section). Errors are never raised: the name of the exception goes in feed["metrics"]["error"].
+    """
+    if not rss_address.lower().startswith(("http://", "https://")):
+        return feedparser.parse(rss_address)
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+
+    metrics = {
+        "status": 0,
+        "cached": 0,
+        "error": "",
+        "bytes": 0,
+        "ttfb": 0.0,
+        "download": 0.0,
+        "parse": 0.0,
+        "total": 0.0,
+    }
+    start = time.perf_counter()
+    parse_error = ""
+
+    try:
+        r = http_get(rss_address, headers=headers,
+                     stream=limit is not None and parse_pool is None)
+        # requests times the wait for the response headers (DNS lookup, connecting, sending the request and the server's answer)
+        metrics["ttfb"] = r.elapsed.total_seconds()
+        metrics["status"] = r.status_code
+        metrics["cached"] = int(getattr(r, "from_cache", False))
+
+        with r:
+            if r.status_code == 304:
+                feed = feedparser.FeedParserDict(feed={}, entries=[])
+            elif limit is None:
+                metrics["bytes"] = len(r.content)
+                t = time.perf_counter()
+                feed = feedparser.parse(
+                    r.content, response_headers=lower_case_headers(r.headers))
+                metrics["parse"] = time.perf_counter() - t
+            elif parse_pool is not None:
+                metrics["bytes"] = len(r.content)
+                t = time.perf_counter()
+                fields, entries, parse_error = parse_pool.submit(
+                    parse_feed, r.content, lower_case_headers(r.headers),
+                    r.url, known, limit,
+                ).result()
+                feed = expand_feed(fields, entries)
+                metrics["parse"] = time.perf_counter() - t
+            else:
+                feed, metrics["bytes"], metrics["parse"] = stream_feed(
+                    r, known, limit)
+    except Exception as e:
+        # unreachable site, or a feed that could not be parsed: return a result with no entries, just as feedparser would, so that one bad feed does not stop the check of the others
+        feed = feedparser.parse(b"")
+        feed["href"] = rss_address
+        metrics["error"] = type(e).__name__
+        metrics["total"] = time.perf_counter() - start
+        feed["metrics"] = metrics
+        return feed
+
+    metrics["download"] = max(
+        0.0, time.perf_counter() - start - metrics["ttfb"] - metrics["parse"])
+
+    if r.status_code >= 400:
+        metrics["error"] = "HTTP " + str(r.status_code)
+    elif parse_error:
+        metrics["error"] = parse_error
+    elif feed.get("bozo") and not feed.get("entries"):
+        # not a feed, or a feed so broken that no post could be read
+        metrics["error"] = type(feed.get("bozo_exception")).__name__
+    metrics["total"] = time.perf_counter() - start
+    feed["metrics"] = metrics
+
+    feed["href"] = r.url
+    feed["status"] = r.status_code
+    feed["etag"] = r.headers.get("ETag", etag if r.status_code == 304 else "")
+    feed["modified"] = r.headers.get(
+        "Last-Modified", modified if r.status_code == 304 else "")
+
+    return feed
+
+
+# namespaces of the feed elements that FeedReader reads: RSS 2.0 (none), Atom, RSS 1.0, Dublin Core (dc:date) and Syndication (sy:updatePeriod)
+FEED_NAMESPACES = (
+    "",
+    "http://www.w3.org/2005/Atom",
+    "http://purl.org/rss/1.0/",
+    "http://purl.org/dc/elements/1.1/",
+    "http://purl.org/rss/1.0/modules/syndication/",
+)
+
+
+def stream_feed(r, known=None, limit=FEED_ENTRY_LIMIT):
+    """
+    Parse an RSS or Atom feed while it is being downloaded (r is a streamed requests.Response), and stop downloading after (limit) posts, or once FEED_KNOWN_RUN posts in a row are in {known}. Posts are thrown away as soon as they have been read, so a feed of any size takes little memory.
+
+    Returns (feed, bytes downloaded, seconds spent parsing). {feed} looks like what feedparser returns, with only the fields that ida uses:
+
+    feed["feed"]: title, link, ttl, sy_updateperiod, sy_updatefrequency
+    feed["entries"]: title, link, id, published, published_parsed, updated, updated_parsed
+
+    Feeds that are not well-formed XML (e.g., with HTML entities such as &nbsp;) are read in full and handed to feedparser, which is more forgiving.
+    """
+    reader = FeedReader(r.url, known, limit)
+    chunks, parse_time, done, read_all = [], 0.0, False, False
+
+    try:
+        for chunk in r.iter_content(FEED_CHUNK_SIZE):
+            chunks.append(chunk)
+            t = time.perf_counter()
+            done = reader.read(chunk)
+            parse_time += time.perf_counter() - t
+            if done:
+                break
+        else:
+            read_all = True
+            reader.close()
+        feed = reader.feed
+    except ET.ParseError:
+        # read the rest of the feed and let feedparser have it all
+        if getattr(r, "from_cache", False):
+            chunks = [r.content]
+        elif not read_all:
+            chunks.extend(r.iter_content(FEED_CHUNK_SIZE))
+        t = time.perf_counter()
+        feed = feedparser.parse(
+            b"".join(chunks), response_headers=lower_case_headers(r.headers))
+        feed["entries"] = feed["entries"][:limit]
+        parse_time += time.perf_counter() - t
+        done = False
+
+    # a feed that was read to the end can go in the HTTP cache, as http_get() does for other downloads
+    if not done and r.status_code == 200 and not getattr(r, "from_cache", False):
+        cache_store(r.url, r.url, r.headers, b"".join(chunks))
+
+    return feed, sum(len(c) for c in chunks), parse_time
+
+
+def parse_feed(content, headers, base_url, known=None, limit=FEED_ENTRY_LIMIT):
+    """
+    Parse a feed that has already been downloaded (content is bytes, headers are lower-case response headers), reading no further than stream_feed() would, and return it in compact form (see compact_feed()).
+
+    It uses nothing but its arguments, so find_all_changes() can run it in other processes.
+    """
+    reader = FeedReader(base_url, known, limit)
+    try:
+        for i in range(0, len(content), FEED_CHUNK_SIZE):
+            if reader.read(content[i: i + FEED_CHUNK_SIZE]):
+                break
+        else:
+            reader.close()
+        feed = reader.feed
+    except ET.ParseError:
+        feed = feedparser.parse(content, response_headers=headers)
+        feed["entries"] = feed["entries"][:limit]
+
+    return compact_feed(feed)
+
+
+# the fields of a feed, and of each of its posts, that compact_feed() keeps
+FEED_FIELDS = ("title", "link", "ttl", "sy_updateperiod", "sy_updatefrequency")
+ENTRY_FIELDS = ("title", "link", "id", "published",
+                "published_parsed", "updated", "updated_parsed")
+
+
+def compact_feed(feed):
+    """
+    Utility that keeps only what get_feed_status() and the refresh schedule use from a parsed feed, as plain values that are quick to send from one process to another:
+
+    ({field: value} for FEED_FIELDS, [(value for each of ENTRY_FIELDS), ...], the class of the parsing error, or "")
+    """
+    fields = {k: feed["feed"][k] for k in FEED_FIELDS if k in feed["feed"]}
+    entries = [tuple(e.get(k) for k in ENTRY_FIELDS) for e in feed["entries"]]
+    error = ""
+    if feed.get("bozo") and not feed["entries"]:
+        error = type(feed.get("bozo_exception")).__name__
+
+    return fields, entries, error
+
+
+def expand_feed(fields, entries):
+    """
+    Utility that turns the output of compact_feed() back into a feed that looks like what feedparser returns.
+    """
+    return feedparser.FeedParserDict(
+        feed=feedparser.FeedParserDict(fields),
+        entries=[
+            feedparser.FeedParserDict(
+                (k, v) for k, v in zip(ENTRY_FIELDS, e) if v is not None)
+            for e in entries
+        ],
+        bozo=0,
+    )
+
+
+class FeedReader:
+    """
+    Reads an RSS 2.0, RSS 1.0 or Atom feed a piece at a time, with ElementTree's XMLPullParser. Used by stream_feed() and parse_feed().
+
+    feed = {"feed": {...}, "entries": [{...}, ...]}, built up as the feed is read; see stream_feed() for the fields read
+
+    read() returns True once (limit) posts have been read, or FEED_KNOWN_RUN posts in a row are in {known}; the rest of the feed does not need to be read. It raises ET.ParseError if the feed is not well-formed XML.
+    """
+
+    def __init__(self, base_url, known=None, limit=FEED_ENTRY_LIMIT):
+        self.base_url = base_url
+        self.known = known
+        self.limit = limit
+        self.feed = feedparser.FeedParserDict(
+            feed=feedparser.FeedParserDict(), entries=[], bozo=0)
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.stack = []
+        self.entry = None
+        self.known_run = 0
+
+    def read(self, data):
+        """
+        Read the next piece of the feed.
+        """
+        self.parser.feed(data)
+        for event, elem in self.parser.read_events():
+            ns, tag = split_xml_tag(elem.tag)
+            if event == "start":
+                self.stack.append(elem)
+                if tag in ("item", "entry"):
+                    self.entry = feedparser.FeedParserDict(title="", link="")
+                    # RSS 1.0 gives the id of a post in rdf:about
+                    about = elem.get(
+                        "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about")
+                    if about:
+                        self.entry["id"] = about
+                continue
+
+            self.stack.pop()
+            parent = self.stack[-1] if self.stack else None
+            if tag in ("item", "entry") and self.entry is not None:
+                self.feed["entries"].append(self.entry)
+                if self.known and article_guid(self.entry) in self.known:
+                    self.known_run += 1
+                else:
+                    self.known_run = 0
+                self.entry = None
+                # forget the post's XML
+                if parent is not None:
+                    parent.remove(elem)
+                if len(self.feed["entries"]) >= self.limit or self.known_run >= FEED_KNOWN_RUN:
+                    return True
+            elif parent is not None:
+                parent_tag = split_xml_tag(parent.tag)[1]
+                if self.entry is not None and parent_tag in ("item", "entry"):
+                    read_feed_element(self.entry, ns, tag, elem, self.base_url)
+                elif self.entry is None and parent_tag in ("channel", "feed"):
+                    read_feed_element(
+                        self.feed["feed"], ns, tag, elem, self.base_url)
+
+        return False
+
+    def close(self):
+        """
+        Finish reading a feed that has been read to the end.
+        """
+        self.parser.close()
+
+
+def read_feed_element(target, ns, tag, elem, base_url):
+    """
+    Utility for stream_feed(): copy one element of a post (or of the feed itself) into {target}, using the same names as feedparser. The first title, link, id, and date of each kind win.
+    """
+    if ns not in FEED_NAMESPACES:
+        return None
+
+    text = (elem.text or "").strip()
+    if tag == "title":
+        if not target.get("title"):
+            target["title"] = text
+    elif tag == "link":
+        # RSS: <link>address</link>; Atom: <link rel="alternate" href="address"/>
+        href = elem.get("href")
+        if href is None:
+            href = text
+        elif elem.get("rel", "alternate") != "alternate":
+            href = ""
+        if href and not target.get("link"):
+            target["link"] = urllib.parse.urljoin(base_url, href)
+    elif tag in ("guid", "id"):
+        target.setdefault("id", text)
+    elif tag in ("pubDate", "published", "issued", "date"):
+        if "published" not in target:
+            target["published"] = text
+            target["published_parsed"] = parse_feed_date(text)
+    elif tag in ("updated", "modified", "lastBuildDate"):
+        if "updated" not in target:
+            target["updated"] = text
+            target["updated_parsed"] = parse_feed_date(text)
+    elif tag == "ttl":
+        target["ttl"] = text
+    elif tag == "updatePeriod":
+        target["sy_updateperiod"] = text
+    elif tag == "updateFrequency":
+        target["sy_updatefrequency"] = text
+
+    return None
+
+
+def split_xml_tag(tag):
+    """
+    Utility that splits an ElementTree tag, "{namespace}name", into (namespace, name).
+    """
+    if tag[:1] == "{":
+        ns, _, name = tag[1:].partition("}")
+        return ns, name
+
+    return "", tag
+
+
+def parse_feed_date(text):
     """
-    Access a feed. Compare the title and link of the most recent post to the title and link stored in {myFeeds}. If they are the same, then the feed has not been updated. If they are different, then in [updated_feeds], flag the feed as having changed.
+    Utility that turns a date in a feed, RSS (RFC 822) or Atom (ISO 8601), into a time.struct_time in UTC, like feedparser's *_parsed dates. Returns None if the date cannot be read.
+    """
+    try:
+        dt = parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    # a date at the very edge of the calendar (e.g., 0001-01-01 in a time zone east of UTC) cannot be moved to UTC
+    try:
+        if dt.tzinfo is None:
+            return dt.timetuple()
+        return dt.utctimetuple()
+    except (OverflowError, ValueError):
+        return None
+
+
+def lower_case_headers(headers):
+    """
+    Utility that returns response headers with lower-case names, which is how feedparser looks for them (e.g., "content-type").
+    """
+    return {k.lower(): v for k, v in headers.items()}
+
+
+def get_feed_status(rss_feed, myFeeds, updated_feeds, bad_feeds, feed_update=None):
+    """
+    Access a feed. Compare the guid of each post with the guids of the posts in the article store. If every post is already known, then the feed has not been updated. If there are new posts, then in [updated_feeds], flag the feed as having changed and list only the new posts. Posts that were reordered, edited, or pinned are not new. If the feed has already been downloaded by find_all_changes(), it is passed in as (feed_update).
+
+    The feed's ETag and Last-Modified values are stored in {myFeeds} and sent with the next request. If the server answers "304 Not Modified", nothing is parsed and the feed is flagged unchanged; only a feed with no saved posts is then downloaded again in full. A feed that find_all_changes() found was not due is flagged unchanged without being downloaded.
+
+    New posts are added to the article store; posts seen in earlier checks are kept.
 
     https://pythonhosted.org/feedparser/http-ETag.html
     https://fishbowl.pastiche.org/2002/10/21/http_conditional_get_for_rss_hackers
@@ -1115,7 +2385,29 @@ def get_feed_status(rss_feed, myFeeds, updated_feeds, bad_feeds):
     feed_title = rss_feed[1]
     rss_address = rss_feed[2]
 
-    feed_update = feedparser.parse(rss_address)
+    feed_id = myFeeds.find(feed_title)
+    feed_info = myFeeds.info(feed_id) if feed_id is not None else Feed()
+
+    known = None
+    if feed_update is None:
+        known = known_articles(feed_title)
+        feed_update = fetch_feed(
+            rss_address, feed_info.etag, feed_info.modified, known, FEED_ENTRY_LIMIT)
+    save_fetch_metrics(feed_title, feed_update)
+
+    # the feed has not changed since the last check, so there are no new posts
+    if feed_update.get("status") == 304:
+        # only the most recent post is needed
+        this_feed = load_feed_articles(
+            feed_title, rss_address, "unchanged", limit=1)
+        # a feed that is not due is not downloaded, even if it has no saved posts (e.g., it was unreachable at its last check)
+        if len(this_feed[feed_title]) > 3 or feed_update.get("not_due"):
+            feed_info.status = "unchanged"
+            updated_feeds.append({feed_title: this_feed[feed_title][:3]})
+            return myFeeds, updated_feeds, bad_feeds
+        # no saved posts for this feed, so download it in full
+        feed_update = fetch_feed(rss_address, limit=FEED_ENTRY_LIMIT)
+        save_fetch_metrics(feed_title, feed_update)
 
     # get the title of the most recent post on the website
     try:
@@ -1140,22 +2432,20 @@ def get_feed_status(rss_feed, myFeeds, updated_feeds, bad_feeds):
             "\n",
             sep="",
         )
+        error = feed_update.get("metrics", {}).get("error")
+        if error:
+            bad_feeds.append({feed_title: [rss_address, error]})
 
-    try:
-        last_title = myFeeds[group][feed_title][5]
-    except:
-        last_title = ""
-    try:
-        last_link = myFeeds[group][feed_title][6]
-    except:
-        last_link = ""
+    # posts already in the article store, {guid: title}
+    if known is None:
+        known = known_articles(feed_title)
 
     """
     {this_feed} = {feed title: [
                         0: feed RSS
                         1: changed/unchanged
-                        2: [most recent post title, most recent post link]
-                        3: [title, link]
+                        2: Article(most recent post title, most recent post link)
+                        3: Article(title, link) of a new post
                         4: ...
                         ]
                     }
@@ -1166,56 +2456,54 @@ def get_feed_status(rss_feed, myFeeds, updated_feeds, bad_feeds):
     # store information in {this_feed} for this feed
     try:
         this_feed.update(
-            {feed_title: [rss_address, "", [
-                most_recent_title, most_recent_link]]}
+            {feed_title: [rss_address, "", Article(
+                most_recent_title, most_recent_link)]}
         )
         posts = []
         for i in feed_update["entries"]:
-            posts.append([i["title"], i["link"]])
+            # only posts with a guid that has not been seen before are new
+            if article_guid(i) not in known:
+                posts.append(Article(i["title"], i["link"]))
 
         this_feed[feed_title].extend(posts)
 
-        # if the last_link or last_title in {myFeeds} != the most_recent_link or most_recent_title, then the feed has been updated, so update {myFeeds}
-        if last_link != most_recent_link or last_title != most_recent_title:
+        # if there are new posts, then the feed has been updated, so update {myFeeds}
+        if posts:
             this_feed[feed_title][1] = "changed"
         else:
             this_feed[feed_title][1] = "unchanged"
 
-        for group, feeds in myFeeds.items():
-            for feed in feeds:
-                if feed == feed_title:
-                    # try:
-                    if last_link != most_recent_link or last_title != most_recent_title:
-                        feeds[feed_title][4] = "changed"
-                        feeds[feed_title][5] = most_recent_title
-                        feeds[feed_title][6] = most_recent_link
-                    else:
-                        feeds[feed_title][4] = "unchanged"
-                # except:
-                #     pass
+        if feed_id is not None:
+            feed_info.etag = feed_update.get("etag", "")
+            feed_info.modified = feed_update.get("modified", "")
+            if posts:
+                feed_info.status = "changed"
+                feed_info.last_title = most_recent_title
+                feed_info.last_link = most_recent_link
+            else:
+                feed_info.status = "unchanged"
 
-        # finally, add {this_feed} to the list of feeds in [updated_feeds]
+        # finally, add {this_feed} to the list of feeds in [updated_feeds] and its new posts to the article store
+        save_feed_articles(feed_title, feed_update["entries"], known)
         updated_feeds.append(this_feed)
-    except:
-        # if feed_update['entries'] raises an exception, add [this_feed] to [bad_feeds]
-        bad_feeds.append(this_feed)
+    except Exception as e:
+        # if feed_update['entries'] raises an exception, add the feed to [bad_feeds]
+        bad_feeds.append({feed_title: [rss_address, type(e).__name__]})
 
     return myFeeds, updated_feeds, bad_feeds
 
 
-def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
+def list_updated_feeds(myFeeds, titles_read=None, bad_feeds=[]):
     """
     Create a list of your feeds. Let user select from that list one feed and then create a list of updated articles for that feed. Default to filtering out articles that have been read. Let user choose articles to read online.
     """
+    if titles_read is None:
+        titles_read = set()
 
-    # retrieve history.json from disk; this file contains [updated_feeds] from the last time the user ran "<c>heck feeds" from the main menu
-    try:
-        with open("history.json", "r", encoding="utf-8") as file:
-            updated_feeds = json.load(file)
-    except FileNotFoundError:
+    # the article store is filled the first time the user runs "<c>heck feeds" from the main menu
+    if not get_db().execute("SELECT 1 FROM articles LIMIT 1").fetchone():
         print('Run "<c>heck feeds" first.')
-        updated_feeds = []
-        return myFeeds, updated_feeds, titles_read
+        return myFeeds, titles_read
 
     # default for article list is to show only unread articles
     show_read = "unread"
@@ -1230,7 +2518,8 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
             print()
             print("=" * 5, " UNREACHABLE FEEDS ", "=" * 5, sep="")
             for i in bad_feeds:
-                print(i)
+                for feed_title, (rss_address, error) in i.items():
+                    print(feed_title, " (", error, "): ", rss_address, sep="")
             print("=" * 29, sep="")
     # =============================================================
 
@@ -1252,7 +2541,7 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                         "\n",
                         "=" * 30,
                         "\nEnter an integer between 1 and ",
-                        len(updated_feeds),
+                        feed_cnt,
                         "\n",
                         "=" * 30,
                         "\n",
@@ -1266,7 +2555,7 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                     "\n",
                     "=" * 30,
                     "\nEnter an integer between 1 and ",
-                    len(updated_feeds),
+                    feed_cnt,
                     "\n",
                     "=" * 30,
                     "\n",
@@ -1279,9 +2568,14 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
             break
         else:
             err = ""
+            # find the chosen feed in {myFeeds}; feeds are numbered as in print_feeds()
+            feed_id = myFeeds.number(choice)
+            feed_title = myFeeds.feeds[feed_id][1]
+            feed_info = myFeeds.info(feed_id)
+            rss_address, status = feed_info.rss, feed_info.status
+
             # [chosen_feed] is a list of attributes of a single feed
-            chosen_feed = updated_feeds[choice - 1]
-            feed_title = list(chosen_feed.keys())[0]
+            chosen_feed = load_feed_articles(feed_title, rss_address, status)
 
             # having chosen a feed, have user choose which post to view
             while True:
@@ -1289,18 +2583,14 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                 chosen_feed = {feed title: [
                                 0: feed RSS
                                 1: changed/unchanged
-                                2: [most recent post title, most recent post link]
-                                3: [title, link]
+                                2: Article(most recent post title, most recent post link)
+                                3: Article(title, link)
                                 4: ...]
                             }
                 """
 
-                # find the number of articles in [chosen_feed] that have already been read
-                cnt_unread_articles = 0
-                for i in range(2, len(chosen_feed[feed_title])):
-                    # hash the link and see if it's in [titles_read]
-                    if hash_a_string(chosen_feed[feed_title][i][1]) not in titles_read:
-                        cnt_unread_articles += 1
+                # find the number of articles in [chosen_feed] that have not been read
+                cnt_unread_articles = unread_counts.get(feed_title, 0)
                 if cnt_unread_articles == 0:
                     print(
                         "\n",
@@ -1319,15 +2609,7 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                             titles_read, chosen_feed)
                     else:
                         # set 'changed' in {myFeeds} for this feed to "unchanged"
-                        # find the feed in {myFeeds}
-                        ndx, done = 0, False
-                        for group, feeds in myFeeds.items():
-                            for this_title, feed_info in feeds.items():
-                                if this_title == feed_title:
-                                    myFeeds[group][feed_title][4] = "unchanged"
-                                    done = True
-                            if done:
-                                break
+                        myFeeds.info(feed_id).status = "unchanged"
                     break
 
                 print()
@@ -1336,16 +2618,16 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                 for cnt in range(3, len(chosen_feed[feed_title])):
                     # if the article hasn't been read, flag it with "*"
                     if (
-                        hash_a_string(chosen_feed[feed_title][cnt][1])
+                        hash_a_string(chosen_feed[feed_title][cnt].link)
                         not in titles_read
                     ):
                         print(
-                            "*", cnt - 2, ": ", chosen_feed[feed_title][cnt][0], sep=""
+                            "*", cnt - 2, ": ", chosen_feed[feed_title][cnt].title, sep=""
                         )
 
                     elif show_read == "read":
                         print(
-                            " ", cnt - 2, ": ", chosen_feed[feed_title][cnt][0], sep=""
+                            " ", cnt - 2, ": ", chosen_feed[feed_title][cnt].title, sep=""
                         )
 
                 print()
@@ -1405,13 +2687,13 @@ def list_updated_feeds(myFeeds, titles_read=[], bad_feeds=[]):
                         continue
 
                     if post:
-                        this_link = chosen_feed[feed_title][post + 2][1]
-                        # print('Showing...', chosen_feed[feed_title][post+2][0])
+                        this_link = chosen_feed[feed_title][post + 2].link
+                        # print('Showing...', chosen_feed[feed_title][post+2].title)
                         # print(this_link)
                         show_lastest_rss(this_link)
 
-                        # hash link; put in [titles_read] so you know it's been read
-                        titles_read.append(hash_a_string(this_link))
+                        # hash link; put in {titles_read} so you know it's been read
+                        mark_read(titles_read, hash_a_string(this_link))
                         print()
                     else:
                         break
@@ -1549,11 +2831,9 @@ def set_to_read_one_article(article_number, chosen_feed, titles_read):
     """
     feed_title = list(chosen_feed.keys())[0]
 
-    link = hash_a_string(chosen_feed[feed_title][article_number + 1][1])
+    link = hash_a_string(chosen_feed[feed_title][article_number + 1].link)
 
-    titles_read.append(link)
-    # strip out repeat titles
-    titles_read = list(set(titles_read))
+    mark_read(titles_read, link)
 
     return titles_read
 
@@ -1565,12 +2845,9 @@ def set_to_unread_one_article(article_number, chosen_feed, titles_read):
     feed_title = list(chosen_feed.keys())[0]
 
     try:
-        link = hash_a_string(chosen_feed[feed_title][article_number + 2][1])
+        link = hash_a_string(chosen_feed[feed_title][article_number + 2].link)
         # in case user chose a title that is unread...
-        try:
-            ndx = titles_read.index(link)
-            titles_read.pop(ndx)
-        except:
+        if not mark_unread(titles_read, link):
             print(
                 "=" * 30,
                 "\nTitle is already marked unread.\n",
@@ -1605,20 +2882,521 @@ def show_lastest_rss(rss):
     return
 
 
-# === STARTUP AND MISCELLANEOUS FUNCTIONS ================
+# === ARTICLE STORE ================
+
+"""
+The articles table in ida.db holds every post seen in a feed, newest first:
 
+articles: feed, guid, title, link, published, hash (hashed link), read, seen (time of the check that found it), position (in the feed at that check)
 
-def about(version_num, revision_number):
+Posts from earlier checks are kept, up to ARTICLES_PER_FEED per feed. The read column mirrors {titles_read}; see build_unread_index().
+"""
+
+
+def save_feed_articles(feed_title, entries, known=None):
     """
-    Information about the author and product.
+    Add the new posts in (entries) (feedparser entries, or dicts with title and link) to the article store. {known} is {guid: title} for the posts already stored (see known_articles()); those keep their place and read status, and are only written if their title has changed.
+
+    If the unread article index has been built, new posts that have already been read (the same link in another feed) are stored as read, and the feed's unread count is updated.
     """
-    print("=" * 45)
+    if known is None:
+        known = known_articles(feed_title)
+
+    seen = int(datetime.now().timestamp())
+    new_rows, edited_titles = [], []
+    for position, entry in enumerate(entries):
+        guid = article_guid(entry)
+        title = entry.get("title", "")
+        if guid in known:
+            if title != known[guid]:
+                edited_titles.append((title, feed_title, guid))
+            continue
+        link = entry.get("link", "")
+        link_hash = hash_a_string(link)
+        read = int(indexed_titles_read is not None and link_hash in indexed_titles_read)
+        new_rows.append(
+            (
+                feed_title,
+                guid,
+                title,
+                link,
+                entry.get("published", ""),
+                link_hash,
+                read,
+                seen,
+                position,
+            )
+        )
 
-    txt1 = (
-        "ida - a small news feed reader\n"
-        + " version: "
-        + str(version_num)
-        + "\n"
+    if not new_rows and not edited_titles:
+        return None
+
+    db = get_db()
+    with db:
+        db.executemany(
+            "UPDATE articles SET title = ? WHERE feed = ? AND guid = ?",
+            edited_titles,
+        )
+        db.executemany(
+            """
+            INSERT OR IGNORE INTO articles (feed, guid, title, link, published, hash, read, seen, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            new_rows,
+        )
+        # forget the oldest posts of this feed
+        db.execute(
+            """
+            DELETE FROM articles WHERE feed = ? AND rowid NOT IN (
+                SELECT rowid FROM articles WHERE feed = ?
+                ORDER BY seen DESC, position LIMIT ?)
+            """,
+            (feed_title, feed_title, ARTICLES_PER_FEED),
+        )
+
+    if unread_counts is not None and new_rows:
+        unread_counts[feed_title] = db.execute(
+            "SELECT COUNT(*) FROM articles WHERE feed = ? AND read = 0", (feed_title,)
+        ).fetchone()[0]
+
+    return None
+
+
+def known_articles(feed_title):
+    """
+    Return {guid: title} for the posts of one feed in the article store.
+    """
+    rows = get_db().execute(
+        "SELECT guid, title FROM articles WHERE feed = ?", (feed_title,))
+
+    return dict(rows.fetchall())
+
+
+# connections to ida.db for the threads of find_all_changes(); see known_article_ids()
+article_readers = threading.local()
+
+
+def known_article_ids(feed_title):
+    """
+    Return the set of guids of the posts of one feed in the article store. Unlike known_articles(), it can be used from any thread: each thread reads ida.db through its own connection.
+    """
+    db = getattr(article_readers, "db", None)
+    if db is None:
+        db = sqlite3.connect(DB_FILE, timeout=30)
+        article_readers.db = db
+    rows = db.execute("SELECT guid FROM articles WHERE feed = ?", (feed_title,))
+
+    return {guid for (guid,) in rows}
+
+
+def article_guid(entry):
+    """
+    Utility that returns the id of a post: its guid (or Atom id) if the feed gives one, otherwise its link.
+    """
+    return entry.get("id") or entry.get("link", "")
+
+
+def load_feed_articles(feed_title, rss_address="", status="", limit=-1):
+    """
+    Read the posts of one feed from the article store, newest first, and return them as {chosen_feed}. With (limit), only that many posts are read.
+
+    {feed title: [
+        0: feed RSS
+        1: changed/unchanged
+        2: Article(most recent post title, most recent post link)
+        3: Article(title, link)
+        4: ...]
+    }
+    """
+    rows = get_db().execute(
+        "SELECT title, link FROM articles WHERE feed = ? ORDER BY seen DESC, position LIMIT ?",
+        (feed_title, limit),
+    )
+    posts = [Article(title, link) for title, link in rows]
+    most_recent = Article(posts[0].title, posts[0].link) if posts else Article()
+
+    return {feed_title: [rss_address, status, most_recent] + posts}
+
+
+def import_history():
+    """
+    Copy the posts in history.json, written by earlier versions of ida, into the article store.
+    """
+    try:
+        with open("history.json", "r", encoding="utf-8") as file:
+            updated_feeds = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    for this_feed in updated_feeds:
+        for feed_title, v in this_feed.items():
+            save_feed_articles(
+                feed_title, [{"title": p[0], "link": p[1]} for p in v[3:]])
+
+    return None
+
+
+# === REFRESH SCHEDULE ================
+
+"""
+The schedule table in ida.db records when each feed should next be checked:
+
+schedule: feed, last_check, next_check, interval (seconds between checks)
+
+The interval is half of the feed's usual time between posts, but never less than the feed's own <ttl> or sy:updatePeriod / sy:updateFrequency, and always between SCHEDULE_MIN_INTERVAL and SCHEDULE_MAX_INTERVAL.
+"""
+
+
+def is_feed_due(feed_title):
+    """
+    Returns True if a feed has never been checked or its next check is due.
+    """
+    row = get_db().execute(
+        "SELECT next_check FROM schedule WHERE feed = ?", (feed_title,)
+    ).fetchone()
+
+    return row is None or row[0] <= time.time()
+
+
+def schedule_next_check(feed_title, feed_update):
+    """
+    Record that a feed has just been checked and work out when to check it next. If (feed_update) has no entries (not modified, or unreachable), the feed keeps its current interval.
+    """
+    now = time.time()
+    db = get_db()
+    row = db.execute(
+        "SELECT interval FROM schedule WHERE feed = ?", (feed_title,)
+    ).fetchone()
+    interval = row[0] if row else SCHEDULE_MIN_INTERVAL
+    if feed_update.get("entries"):
+        interval = feed_check_interval(feed_update)
+
+    with db:
+        db.execute(
+            "INSERT OR REPLACE INTO schedule (feed, last_check, next_check, interval) VALUES (?, ?, ?, ?)",
+            (feed_title, now, now + interval, interval),
+        )
+
+    return None
+
+
+def reset_schedule(feed_title):
+    """
+    Forget when a feed is next due, so that the next "<c>heck feeds" checks it. Used by edit_RSS_address().
+    """
+    db = get_db()
+    with db:
+        db.execute("DELETE FROM schedule WHERE feed = ?", (feed_title,))
+
+    return None
+
+
+def feed_check_interval(feed_update):
+    """
+    Work out the number of seconds between checks of a feed from the dates of its posts and from the feed's own hints.
+    """
+    dates = []
+    for entry in feed_update["entries"]:
+        parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+        if parsed:
+            dates.append(calendar.timegm(parsed))
+    dates.sort(reverse=True)
+
+    # check twice for every post, on average
+    gaps = [a - b for a, b in zip(dates, dates[1:]) if a > b]
+    interval = statistics.median(gaps) / 2 if gaps else SCHEDULE_MIN_INTERVAL
+
+    # don't check more often than the feed asks
+    hint = feed_refresh_hint(feed_update.get("feed", {}))
+    if hint:
+        interval = max(interval, hint)
+
+    return min(max(interval, SCHEDULE_MIN_INTERVAL), SCHEDULE_MAX_INTERVAL)
+
+
+def feed_refresh_hint(feed):
+    """
+    Returns the number of seconds a feed asks readers to wait between checks, from <ttl> (minutes) or sy:updatePeriod / sy:updateFrequency, or 0 if the feed doesn't say.
+    """
+    periods = {
+        "hourly": 60 * 60,
+        "daily": 24 * 60 * 60,
+        "weekly": 7 * 24 * 60 * 60,
+        "monthly": 30 * 24 * 60 * 60,
+        "yearly": 365 * 24 * 60 * 60,
+    }
+
+    try:
+        if feed.get("ttl"):
+            return int(feed["ttl"]) * 60
+        period = feed.get("sy_updateperiod", "").strip().lower()
+        if period in periods:
+            frequency = int(feed.get("sy_updatefrequency") or 1)
+            return periods[period] / max(frequency, 1)
+    except ValueError:
+        pass
+
+    return 0
+
+
+# === FETCH METRICS ================
+
+"""
+The fetches table in ida.db records each download of a feed by "<c>heck feeds", so the feeds that slow down every check can be found:
+
+fetches: feed, time (when it was downloaded), status (HTTP status, or 0 if the website could not be reached), cached (1 if the feed came from http_cache.db), error (what went wrong, or ""), bytes, ttfb (seconds until the response headers arrived: DNS lookup, connecting and the server's answer), download (seconds to read the content), parse (seconds in feedparser), total
+
+Only the last FETCHES_PER_FEED downloads of each feed are kept. "feed <s>tats" in the main menu shows them and exports them as JSON.
+"""
+
+
+def save_fetch_metrics(feed_title, feed_update):
+    """
+    Add the metrics of one download (feed_update["metrics"], see fetch_feed()) to the fetches table. A feed that was not downloaded has no metrics and is not recorded.
+    """
+    metrics = feed_update.get("metrics")
+    if not metrics:
+        return None
+
+    db = get_db()
+    with db:
+        db.execute(
+            "INSERT INTO fetches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                feed_title,
+                time.time(),
+                metrics["status"],
+                metrics["cached"],
+                metrics["error"],
+                metrics["bytes"],
+                metrics["ttfb"],
+                metrics["download"],
+                metrics["parse"],
+                metrics["total"],
+            ),
+        )
+        # forget the oldest downloads of this feed
+        db.execute(
+            """
+            DELETE FROM fetches WHERE feed = ? AND rowid NOT IN (
+                SELECT rowid FROM fetches WHERE feed = ? ORDER BY time DESC LIMIT ?)
+            """,
+            (feed_title, feed_title, FETCHES_PER_FEED),
+        )
+
+    return None
+
+
+def fetch_stats():
+    """
+    Return a summary of the fetches table, one dict for each feed, slowest feed (on average) first.
+    """
+    db = get_db()
+    last = {
+        feed: (status, error)
+        for feed, status, error in db.execute(
+            """
+            SELECT feed, status, error FROM fetches f
+            WHERE time = (SELECT MAX(time) FROM fetches WHERE feed = f.feed)
+            """
+        )
+    }
+    rows = db.execute(
+        """
+        SELECT feed, COUNT(*), AVG(total), MAX(total), AVG(ttfb), AVG(download), AVG(parse),
+            AVG(bytes), SUM(status = 304), SUM(cached), SUM(error != '')
+        FROM fetches GROUP BY feed ORDER BY AVG(total) DESC
+        """
+    )
+    stats = []
+    for row in rows:
+        stats.append(
+            dict(
+                zip(
+                    (
+                        "feed",
+                        "fetches",
+                        "avg_total",
+                        "max_total",
+                        "avg_ttfb",
+                        "avg_download",
+                        "avg_parse",
+                        "avg_bytes",
+                        "not_modified",
+                        "cached",
+                        "errors",
+                    ),
+                    row,
+                )
+            )
+        )
+        stats[-1]["last_status"], stats[-1]["last_error"] = last.get(row[0], (0, ""))
+
+    return stats
+
+
+def show_fetch_stats():
+    """
+    Print how long each feed took to download and parse, over its last FETCHES_PER_FEED downloads, slowest first. Optionally, export the metrics to a JSON file.
+    """
+    stats = fetch_stats()
+    if not stats:
+        print('\nRun "<c>heck feeds" first.')
+        return ""
+
+    print()
+    print("=" * 30, " FEED STATS ", "=" * 30, sep="")
+    print("{:>6} {:>6} {:>6} {:>6} {:>6} {:>7} {:>5} {:>4}  {}".format(
+        "avg s", "max s", "ttfb", "down", "parse", "KB", "304s", "err", "feed"))
+    for f in stats:
+        feed_title = f["feed"]
+        if f["last_error"]:
+            feed_title += " (" + f["last_error"] + ")"
+        print("{:>6.2f} {:>6.2f} {:>6.2f} {:>6.2f} {:>6.2f} {:>7.1f} {:>5} {:>4}  {}".format(
+            f["avg_total"], f["max_total"], f["avg_ttfb"], f["avg_download"],
+            f["avg_parse"], f["avg_bytes"] / 1024,
+            str(f["not_modified"]) + "/" + str(f["fetches"]), f["errors"], feed_title))
+    print("=" * 72)
+
+    file = input("\nExport to JSON file (Enter to skip): ")
+    if not file:
+        return ""
+
+    try:
+        export_fetch_stats(file)
+    except OSError:
+        err = "Could not write " + file + "."
+        return err
+
+    print("Feed stats exported to", file)
+    return ""
+
+
+def export_fetch_stats(file):
+    """
+    Utility to write the fetch metrics to (file) as JSON: {"feeds": the summary from fetch_stats(), "fetches": every download in the fetches table}.
+    """
+    columns = ("feed", "time", "status", "cached", "error", "bytes",
+               "ttfb", "download", "parse", "total")
+    fetches = [
+        dict(zip(columns, row))
+        for row in get_db().execute(
+            "SELECT " + ", ".join(columns) + " FROM fetches ORDER BY feed, time")
+    ]
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump({"feeds": fetch_stats(), "fetches": fetches},
+                  f, ensure_ascii=False, indent=2)
+
+    return None
+
+
+# === UNREAD ARTICLE INDEX ================
+
+"""
+unread_counts = {feed title: number of unread articles in the article store}
+
+unread_counts is None until build_unread_index() is run. mark_read() and mark_unread() keep it up to date as articles are read, and save_feed_articles() as new articles arrive, so print_feeds() never has to hash a link.
+
+indexed_titles_read is the {titles_read} that the index was built from.
+"""
+unread_counts = None
+indexed_titles_read = None
+
+
+def build_unread_index(titles_read):
+    """
+    Bring the read column of the article store in line with {titles_read}, then count the unread articles in each feed. Links were hashed when they were stored, so nothing is hashed here.
+    """
+    global unread_counts, indexed_titles_read
+
+    indexed_titles_read = titles_read
+    db = get_db()
+    changed = []
+    for link, read in db.execute("SELECT DISTINCT hash, read FROM articles"):
+        if (link in titles_read) != bool(read):
+            changed.append((int(not read), link))
+    with db:
+        db.executemany("UPDATE articles SET read = ? WHERE hash = ?", changed)
+
+    unread_counts = dict(
+        db.execute(
+            "SELECT feed, COUNT(*) FROM articles WHERE read = 0 GROUP BY feed")
+    )
+
+    return None
+
+
+def clear_unread_index():
+    """
+    Throw away the unread article index, e.g., after the article store has changed. It is rebuilt by print_feeds().
+    """
+    global unread_counts, indexed_titles_read
+
+    unread_counts, indexed_titles_read = None, None
+
+    return None
+
+
+def mark_read(titles_read, link):
+    """
+    Add a hashed link to {titles_read} and update the unread counts of the feeds that contain it. Returns False if the article was already read.
+    """
+    if link in titles_read:
+        return False
+
+    titles_read.add(link)
+    if unread_counts is not None:
+        set_article_read(link, 1)
+
+    return True
+
+
+def mark_unread(titles_read, link):
+    """
+    Remove a hashed link from {titles_read} and update the unread counts of the feeds that contain it. Returns False if the article was already unread.
+    """
+    if link not in titles_read:
+        return False
+
+    titles_read.discard(link)
+    if unread_counts is not None:
+        set_article_read(link, 0)
+
+    return True
+
+
+def set_article_read(link, read):
+    """
+    Utility to set the read column of every article with this hashed link, and adjust {unread_counts}. Used by mark_read() and mark_unread().
+    """
+    db = get_db()
+    rows = db.execute(
+        "SELECT feed, COUNT(*) FROM articles WHERE hash = ? AND read = ? GROUP BY feed",
+        (link, 1 - read),
+    ).fetchall()
+    for feed_title, n in rows:
+        unread_counts[feed_title] = unread_counts.get(
+            feed_title, 0) + (-n if read else n)
+    with db:
+        db.execute("UPDATE articles SET read = ? WHERE hash = ?", (read, link))
+
+    return None
+
+
+# === STARTUP AND MISCELLANEOUS FUNCTIONS ================
+
+
+def about(version_num, revision_number):
+    """
+    Information about the author and product.
+    """
+    print("=" * 45)
+
+    txt1 = (
+        "ida - a small news feed reader\n"
+        + " version: "
+        + str(version_num)
+        + "\n"
         + "revision: "
         + str(revision_number)
         + "\n"
@@ -1644,27 +3422,492 @@ def fold(txt):
 
 def hash_a_string(this_string):
     """
-    Create a hash value for a string (this_string). This utility is used to hash links before storing the link in [titles_read]. Hashing saves disk space, speeds searching the [list], and, because of simplicity, reduces error.
+    Create a hash value for a string (this_string). This utility is used to hash links before storing the link in {titles_read}. The hash is a 64-bit integer (blake2b), which is small, quick to compare, and wide enough that two links will practically never get the same hash.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(this_string.encode("utf-8"), digest_size=8).digest(),
+        "big",
+        signed=True,
+    )
+
+
+def legacy_hash_a_string(this_string):
+    """
+    The hash used by earlier versions of ida: sha256, reduced to 8 decimal digits. Used only to read old titles_read.txt files.
     """
     return str(
         int(hashlib.sha256(this_string.encode("utf-8")).hexdigest(), 16) % 10 ** 8
     )
 
 
+class TitlesRead:
+    """
+    {titles_read}: the hashed links of articles that have been read. It is used like a set: titles_read.add(hash), titles_read.discard(hash), and "hash in titles_read".
+
+    The hashes are kept in a binary file (TITLES_READ_FILE):
+    - 8 bytes: b"idaread1"
+    - 8 bytes: the number of sorted hashes that follow (little-endian)
+    - the sorted hashes, 8 bytes each (64-bit integers in the machine's byte order)
+    - hashes added since the file was last sorted, 8 bytes each
+
+    The file is not read until the first time it is needed. The sorted hashes are memory-mapped and searched with bisect, so they are never loaded into a python set. A hash is appended to the file as soon as an article is read. Articles marked unread, and the sorting of appended hashes, are saved by compact() when ida quits.
+    """
+
+    MAGIC = b"idaread1"
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.opened = False
+        self.map = None
+        self.sorted_hashes = []
+        self.added = set()
+        self.removed = set()
+
+    def open(self):
+        """
+        Map the sorted hashes and read the appended hashes, the first time they are needed.
+        """
+        if self.opened:
+            return
+        self.opened = True
+
+        try:
+            file = open(self.filename, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            header = file.read(16)
+            if header[:8] != self.MAGIC:
+                return
+            n = int.from_bytes(header[8:16], "little")
+            if n:
+                self.map = mmap.mmap(
+                    file.fileno(), 16 + 8 * n, access=mmap.ACCESS_READ)
+                self.sorted_hashes = memoryview(self.map)[16:].cast("q")
+            file.seek(16 + 8 * n)
+            tail = file.read()
+            appended = array("q")
+            appended.frombytes(tail[: len(tail) // 8 * 8])
+            self.added.update(appended)
+
+    def close(self):
+        """
+        Unmap the file. It is opened again the next time it is needed.
+        """
+        if self.map is not None:
+            self.sorted_hashes.release()
+            self.map.close()
+        self.opened = False
+        self.map = None
+        self.sorted_hashes = []
+        self.added = set()
+        self.removed = set()
+
+    def in_sorted(self, link):
+        """
+        Binary search for a hash in the sorted (memory-mapped) part of the file.
+        """
+        i = bisect.bisect_left(self.sorted_hashes, link)
+        return i < len(self.sorted_hashes) and self.sorted_hashes[i] == link
+
+    def __contains__(self, link):
+        self.open()
+        if link in self.added:
+            return True
+        if link in self.removed:
+            return False
+        return self.in_sorted(link)
+
+    def add(self, link):
+        """
+        Mark an article read, appending its hash to the file straight away.
+        """
+        if link in self:
+            return
+        if link in self.removed:
+            # it is still in the file
+            self.removed.discard(link)
+            if not self.in_sorted(link):
+                self.added.add(link)
+            return
+        self.added.add(link)
+        if not os.path.exists(self.filename):
+            write_titles_read_file(self.filename, [])
+        with open(self.filename, "ab") as file:
+            file.write(array("q", [link]).tobytes())
+
+    def discard(self, link):
+        """
+        Mark an article unread. This is saved by compact(). [removed] holds every article in the file that has been marked unread, whether it is in the sorted part or was appended.
+        """
+        self.open()
+        if link in self.added:
+            self.added.discard(link)
+            self.removed.add(link)
+        elif self.in_sorted(link):
+            self.removed.add(link)
+
+    def __iter__(self):
+        self.open()
+        for link in self.sorted_hashes:
+            if link not in self.removed:
+                yield link
+        for link in self.added:
+            if not self.in_sorted(link):
+                yield link
+
+    def __len__(self):
+        return sum(1 for link in self)
+
+    def compact(self):
+        """
+        Rewrite the file with every hash sorted, dropping the articles marked unread by this ida. The file is read again first, so that articles read by another ida running at the same time (e.g., "python ida.py mark-read" while the menu is open) are kept.
+        """
+        removed = self.removed
+        self.close()
+        self.open()
+        hashes = sorted(set(self) - removed)
+        self.close()
+        write_titles_read_file(self.filename, hashes)
+
+
+def write_titles_read_file(filename, hashes):
+    """
+    Utility to write sorted hashes to a titles_read file in the layout described in TitlesRead. The file is written to a temporary file that then replaces (filename), so a crash never leaves a half-written file.
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as file:
+        file.write(TitlesRead.MAGIC)
+        file.write(len(hashes).to_bytes(8, "little"))
+        file.write(array("q", hashes).tobytes())
+    os.replace(tmp_filename, filename)
+
+    return None
+
+
+def load_titles_read():
+    """
+    Return {titles_read}, the hashed links of articles that have been read. Nothing is read from disk until the first time it is used (see TitlesRead).
+
+    The first time, the hashes in titles_read.txt, written by earlier versions of ida, are copied into the binary file. Each line of that file is a link hashed to 8 decimal digits (see legacy_hash_a_string()); they are converted by looking up the links in the article store. Links that are no longer in any feed can never be shown again, so they are dropped.
+    """
+    if not os.path.exists(TITLES_READ_FILE) and os.path.exists("titles_read.txt"):
+        hashes, legacy = set(), set()
+        with open("titles_read.txt", "r") as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    legacy.add(line)
+
+        if legacy:
+            for (link,) in get_db().execute("SELECT DISTINCT link FROM articles"):
+                if legacy_hash_a_string(link) in legacy:
+                    hashes.add(hash_a_string(link))
+
+        write_titles_read_file(TITLES_READ_FILE, sorted(hashes))
+
+    return TitlesRead(TITLES_READ_FILE)
+
+
+def save_titles_read(titles_read):
+    """
+    Utility to save {titles_read}. Read articles are already in the file; this sorts it and removes articles that were marked unread.
+    """
+    titles_read.compact()
+
+    return None
+
+
 def load_myFeeds_dict():
     """
-    Read myFeeds.json and return a dictionary of the RSS feeds. Each key is a group and each value is a list of RSS feeds in that group.
+    Read {myFeeds} from the database (ida.db) and return a dictionary of the RSS feeds. Each key is a group and each value is a dictionary of RSS feeds in that group. The first time ida runs with a database, the feeds in myFeeds.json (if any) are copied into it.
+    """
+    global saved_groups, saved_feeds
+
+    db = get_db()
+    groups = db.execute("SELECT name FROM groups ORDER BY position").fetchall()
+
+    if not groups:
+        try:
+            with open("myFeeds.json", "r") as file:
+                myFeeds = json.load(file)
+            # an empty group may have been saved as a list
+            myFeeds = FeedRegistry(myFeeds)
+        except FileNotFoundError:
+            # at a minimum, {myFeeds} contains a default group
+            myFeeds = FeedRegistry({"Default": {}})
+        save_myFeeds(myFeeds)
+        return myFeeds
+
+    myFeeds = FeedRegistry({group: {} for (group,) in groups})
+    saved_groups = {group: pos for pos, (group,) in enumerate(groups)}
+    saved_feeds = {}
+    rows = db.execute(
+        """
+        SELECT f.grp, f.title, f.position, f.info
+        FROM feeds f JOIN groups g ON f.grp = g.name
+        ORDER BY g.position, f.position
+        """
+    )
+    for group, feed_title, position, info in rows:
+        myFeeds.add_feed(group, feed_title, json.loads(info))
+        saved_feeds[(group, feed_title)] = (position, info)
+
+    return myFeeds
+
+
+def get_db():
+    """
+    Return the connection to the database (ida.db), creating the tables the first time.
+
+    groups: name, position
+    feeds:  grp, title, position, info (the feed's list from {myFeeds}, as JSON)
+    articles: see the ARTICLE STORE section
+    schedule: see the REFRESH SCHEDULE section
+    """
+    global db_connection
+
+    if db_connection is None:
+        # the database may be in use by "ida.py --daemon" as well, so wait for it rather than fail
+        db_connection = sqlite3.connect(DB_FILE, timeout=30)
+        # write-ahead logging: a crash during a save leaves the last good save intact
+        db_connection.execute("PRAGMA journal_mode=WAL")
+        db_connection.execute("PRAGMA synchronous=NORMAL")
+        db_connection.executescript(DB_SCHEMA)
+        # version 1: the posts in history.json have been brought in; this is done only once, so that they do not come back after every feed has been deleted
+        if db_connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            import_history()
+            db_connection.execute("PRAGMA user_version = 1")
+
+    return db_connection
+
+
+# === COMMAND LINE ================
+
+"""
+"python ida.py <command>" runs one command without the menu and prints its result as JSON, so ida can be run from cron or another program:
+
+refresh [--all] [--processes N]                 check the feeds that are due (or every feed), like "<c>heck feeds"
+list [--unread] [--feed TITLE] [--limit N]      list the articles in the article store, by feed
+import FILE [--replace]                         add the feeds in an OPML file, or replace all feeds with them
+export FILE                                     write the feeds to an OPML file, like "e<x>port OPML"
+mark-read [LINK ...] [--feed TITLE] [--all]     mark articles read, by link, by feed, or all of them
+
+Messages that the menu would print go to stderr, so stdout holds only the JSON. The exit status is 1 if the result has an "error".
+"""
+
+
+def command_line(args):
+    """
+    Run the command in [args] (the arguments after "ida.py"), print its result as JSON and return the exit status.
+    """
+    args = command_parser().parse_args(args)
+
+    with contextlib.redirect_stdout(stderr):
+        titles_read = load_titles_read()
+        myFeeds = load_myFeeds_dict()
+        # each command saves what it changes itself; see command_refresh(), command_import() and command_mark_read()
+        myFeeds, titles_read, result = args.command(args, myFeeds, titles_read)
+
+    json.dump(result, stdout, ensure_ascii=False, indent=2)
+    print(file=stdout)
+
+    return 1 if "error" in result else 0
+
+
+def command_parser():
+    """
+    Utility that returns the argparse parser for command_line(). Each command's function is stored as its "command" default.
+    """
+    parser = argparse.ArgumentParser(
+        prog="ida.py",
+        description="Run one ida command without the menu and print the result as JSON. Run without a command to open the menu.",
+        epilog="Other options: --daemon (check feeds in the background), --timing (show startup times).",
+    )
+    commands = parser.add_subparsers(title="commands", metavar="command")
+    commands.required = True
+
+    p = commands.add_parser(
+        "refresh", help="check the feeds that are due for new articles")
+    p.add_argument("--all", action="store_true",
+                   help="check every feed, even those that are not due")
+    p.add_argument("--processes", type=int, default=PARSE_PROCESSES, metavar="N",
+                   help="number of processes that parse feeds in large checks (0: none)")
+    p.set_defaults(command=command_refresh)
+
+    p = commands.add_parser("list", help="list the articles of each feed")
+    p.add_argument("--unread", action="store_true",
+                   help="list only articles that have not been read")
+    p.add_argument("--feed", action="append", metavar="TITLE",
+                   help="list only this feed (may be given more than once)")
+    p.add_argument("--limit", type=int, default=-1, metavar="N",
+                   help="list at most N articles of each feed")
+    p.set_defaults(command=command_list)
+
+    p = commands.add_parser("import", help="add the feeds in an OPML file")
+    p.add_argument("file")
+    p.add_argument("--replace", action="store_true",
+                   help="replace all of your feeds with the imported feeds")
+    p.set_defaults(command=command_import)
+
+    p = commands.add_parser("export", help="write your feeds to an OPML file")
+    p.add_argument("file")
+    p.set_defaults(command=command_export)
+
+    p = commands.add_parser("mark-read", help="mark articles read")
+    p.add_argument("links", nargs="*", metavar="LINK",
+                   help="link of an article to mark read")
+    p.add_argument("--feed", action="append", metavar="TITLE",
+                   help="mark every article of this feed read (may be given more than once)")
+    p.add_argument("--all", action="store_true",
+                   help="mark every article read")
+    p.set_defaults(command=command_mark_read)
+
+    return parser
+
+
+def command_refresh(args, myFeeds, titles_read):
+    """
+    "refresh": check the feeds that are due (every feed with --all), save what changed as daemon() does, and return the new articles of each changed feed and the feeds that could not be read.
+    """
+    t = time.perf_counter()
+    updated_feeds, bad_feeds, myFeeds = find_all_changes(
+        myFeeds, force=args.all, processes=args.processes)
+    # the menu or the daemon may have changed the feeds during the check; keep their changes
+    save_feed_states(myFeeds)
+
+    changed = []
+    for this_feed in updated_feeds:
+        for feed_title, v in this_feed.items():
+            if v[1] == "changed":
+                changed.append(
+                    {
+                        "feed": feed_title,
+                        "rss": v[0],
+                        "new": [{"title": p.title, "link": p.link} for p in v[3:]],
+                    }
+                )
+    errors = [
+        {"feed": feed_title, "rss": rss_address, "error": error}
+        for i in bad_feeds
+        for feed_title, (rss_address, error) in i.items()
+    ]
+
+    result = {
+        "feeds": len(myFeeds.feeds),
+        "seconds": round(time.perf_counter() - t, 3),
+        "changed": changed,
+        "errors": errors,
+    }
+    return myFeeds, titles_read, result
+
+
+def command_list(args, myFeeds, titles_read):
+    """
+    "list": return each feed, by group, with its articles from the article store, newest first. With --unread, only unread articles are listed.
+    """
+    build_unread_index(titles_read)
+
+    feeds = []
+    for group, group_feeds in myFeeds.items():
+        for feed_title, feed_info in group_feeds.items():
+            if args.feed and feed_title not in args.feed:
+                continue
+            rows = get_db().execute(
+                """
+                SELECT title, link, published, read FROM articles
+                WHERE feed = ? AND (read = 0 OR ? = 0)
+                ORDER BY seen DESC, position LIMIT ?
+                """,
+                (feed_title, args.unread, args.limit),
+            )
+            feeds.append(
+                {
+                    "group": group,
+                    "feed": feed_title,
+                    "rss": feed_info.rss,
+                    "status": feed_info.status,
+                    "unread": unread_counts.get(feed_title, 0),
+                    "articles": [
+                        {"title": title, "link": link,
+                            "published": published, "read": bool(read)}
+                        for title, link, published, read in rows
+                    ],
+                }
+            )
+
+    result = {"feeds": feeds}
+    if args.feed and len(feeds) < len(set(args.feed)):
+        result["error"] = "Feed not found: " + ", ".join(
+            sorted(set(args.feed) - {f["feed"] for f in feeds}))
+    return myFeeds, titles_read, result
+
+
+def command_import(args, myFeeds, titles_read):
+    """
+    "import": add the feeds in an OPML file whose links are valid to {myFeeds}, or, with --replace, replace all feeds with them, as "<i>mport OPML" does, and save {myFeeds}. Feeds with a title that is already in {myFeeds} are not added.
     """
     try:
-        with open("myFeeds.json", "r") as file:
-            myFeeds = json.load(file)
+        new_feeds = list(read_OPML(args.file))
     except FileNotFoundError:
-        # at a minimum, {myFeeds} contains a default group
-        myFeeds = {"Default": []}
+        return myFeeds, titles_read, {"error": args.file + " not found."}
+    except ET.ParseError:
+        return myFeeds, titles_read, {"error": args.file + " is not a valid OPML file."}
 
-        myFeeds = load_myFeeds_dict()
+    imported, bad_links = OPML_feeds(new_feeds)
 
-    return myFeeds
+    skipped = []
+    if args.replace:
+        myFeeds = imported
+    else:
+        for feed_id in list(imported.feeds):
+            group, feed_title = imported.feeds[feed_id]
+            if myFeeds.find(feed_title) is not None:
+                skipped.append(feed_title)
+            else:
+                myFeeds.add_feed(group, feed_title, imported.info(feed_id))
+    myFeeds = clean_feeds(myFeeds)
+
+    result = {
+        "imported": len(imported.feeds) - len(skipped),
+        "skipped": skipped,
+        "bad_links": [
+            {"feed": this_title, "link": this_URL, "status": status_code}
+            for this_title, this_URL, status_code in bad_links
+        ],
+    }
+    return myFeeds, titles_read, result
+
+
+def command_export(args, myFeeds, titles_read):
+    """
+    "export": write {myFeeds} to an OPML file, as "e<x>port OPML" does.
+    """
+    try:
+        write_OPML(myFeeds, args.file)
+    except OSError:
+        return myFeeds, titles_read, {"error": "Could not write " + args.file + "."}
+
+    result = {"exported": len(myFeeds.feeds), "file": args.file}
+    return myFeeds, titles_read, result
+
+
+def command_mark_read(args, myFeeds, titles_read):
+    """
+    "mark-read": mark the articles with the given links read, and every article of the feeds given with --feed (or of every feed, with --all). Returns the number of articles that were not already read. Only this command saves {titles_read}.
+    """
+    build_unread_index(titles_read)
+
+    links = set(args.links)
+    if args.all or args.feed:
+        rows = get_db().execute("SELECT feed, link FROM articles WHERE read = 0")
+        links.update(
+            link for feed_title, link in rows if args.all or feed_title in args.feed)
+
+    marked = sum(mark_read(titles_read, hash_a_string(link)) for link in links)
+    save_titles_read(titles_read)
+
+    return myFeeds, titles_read, {"marked": marked}
 
 
 # === MAIN MENU ================
@@ -1675,18 +3918,19 @@ def main_menu(myFeeds, titles_read, err):
     Print the main menu on the screen and direct the user's choice.
     """
     menu = (
-        "<i>mport OPML     ",
+        "<i>mport OPML       ",
         "<c>heck feeds   ",
         "<a>dd feed    ",
-        "<e>dit group      ",
+        "<e>dit group        ",
         "<l>ist feeds    ",
         "<d>elete feed ",
-        "edit <r>ss address",
-        "                ",
+        "edit <r>ss address  ",
+        "e<x>port OPML   ",
         "<m>ove feed   ",
-        "                  ",
+        "<u>pdate all feeds  ",
         "a<b>out         ",
         "<q>uit        ",
+        "feed <s>tats        ",
     )
 
     while True:
@@ -1716,6 +3960,13 @@ def main_menu(myFeeds, titles_read, err):
             myFeeds, titles_read = list_updated_feeds(
                 myFeeds, titles_read, bad_feeds)
 
+        elif menu_choice.upper() == "U":
+            # check every feed, even those that are not due
+            updated_feeds, bad_feeds, myFeeds = find_all_changes(
+                myFeeds, force=True)
+            myFeeds, titles_read = list_updated_feeds(
+                myFeeds, titles_read, bad_feeds)
+
         elif menu_choice.upper() == "D":
             myFeeds = del_feed(myFeeds, titles_read)
 
@@ -1733,6 +3984,10 @@ def main_menu(myFeeds, titles_read, err):
                 print("OPML file successfully imported.")
 
         elif menu_choice.upper() == "L":
+            # pick up feeds that "ida.py --daemon" has checked in the background
+            save_myFeeds(myFeeds)
+            myFeeds = load_myFeeds_dict()
+            clear_unread_index()
             myFeeds, titles_read = list_updated_feeds(myFeeds, titles_read)
 
         elif menu_choice.upper() == "M":
@@ -1741,8 +3996,13 @@ def main_menu(myFeeds, titles_read, err):
         elif menu_choice.upper() == "R":
             myFeeds = edit_RSS_address(myFeeds, titles_read)
 
+        elif menu_choice.upper() == "S":
+            err = show_fetch_stats()
+
         elif menu_choice.upper() == "X":
-            pass
+            err = export_OPML(myFeeds)
+            if not err:
+                print("OPML file successfully exported.")
 
         else:
             print("*" * 35)
@@ -1758,31 +4018,52 @@ def main():
     The main program that organizes program flow.
     """
 
-    # before starting the app, read [titles_read] and {myFeeds} from disk
-    try:
-        with open("titles_read.txt", "r") as file:
-            all_titles = file.readlines()
-        titles_read = [line.strip("\n") for line in all_titles]
-    except FileNotFoundError:
-        titles_read = []
+    # before starting the app, read {titles_read} and {myFeeds} from disk
+    t = time.perf_counter()
+    titles_read = load_titles_read()
+    startup_times["open read articles"] = time.perf_counter() - t
 
+    t = time.perf_counter()
     myFeeds = load_myFeeds_dict()
+    startup_times["load feeds"] = time.perf_counter() - t
+
+    startup_times["total startup"] = time.perf_counter() - ida_start
+    if "--timing" in argv[1:]:
+        print_startup_times()
 
     # display menu on screen
     err = ""
     myFeeds, titles_read = main_menu(myFeeds, titles_read, err)
 
-    # before quitting the app save [titles_read] and {myFeeds}
-    titles_read_set = set(titles_read)
-    with open("titles_read.txt", "w") as file:
-        for i in titles_read_set:
-            file.write(i + "\n")
+    # before quitting the app save {titles_read} and {myFeeds}
+    save_titles_read(titles_read)
 
     save_myFeeds(myFeeds)
 
     return
 
 
+def daemon(interval=DAEMON_INTERVAL):
+    """
+    Run ida without the menu, checking the feeds that are due every (interval) seconds until stopped with Ctrl-C. Results go to the same database (ida.db) as "<c>heck feeds", so the menu, started separately, can list articles straight away.
+    """
+    print("Checking feeds every", interval // 60, "minutes. Press Ctrl-C to stop.")
+
+    try:
+        while True:
+            # read the feeds again each round, to pick up feeds added or deleted from the menu
+            myFeeds = load_myFeeds_dict()
+            print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), end="")
+            updated_feeds, bad_feeds, myFeeds = find_all_changes(myFeeds)
+            # the menu may have changed the feeds during the check; keep its changes
+            save_feed_states(myFeeds)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+    return
+
+
 def get_revision_number():
     """
     Returns the revision number, which is the number of days since the initial coding of "ida" began on June, 10, 2019.
@@ -1799,9 +4080,18 @@ if __name__ == "__main__":
 
     version_num = "1.0"
     revision_number = 30
+
+    # "python ida.py refresh" and the other commands print only JSON; see command_line()
+    if argv[1:] and (not argv[1].startswith("-") or argv[1] in ("-h", "--help")):
+        raise SystemExit(command_line(argv[1:]))
+
     print("ida " + version_num + " - a small news feed reader")
 
-    main()
+    # "python ida.py --daemon" checks feeds in the background; otherwise show the menu
+    if "--daemon" in argv[1:]:
+        daemon()
+    else:
+        main()
 
     # ============ UTILITY FUNCTIONS FOR TESTING PURPOSES ============
 